@@ -0,0 +1,279 @@
+import argparse
+import os
+import time
+
+import numpy as np
+from langchain.vectorstores.faiss import dependable_faiss_import
+
+from vector_store import RERANK_FACTOR, VECTORS_FILE, is_lossy, load_store, rerank_rows, save_store, store_dir
+
+# Approximate search: ivf_flat, ivf_pq, hnsw. Compressed vectors searched
+# exhaustively: sq_fp16 (2 bytes per dimension), sq_int8 (1 byte), pq
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq_fp16", "sq_int8", "pq")
+# IVF lists default to about 4 * sqrt(n); k-means wants at least
+# MIN_POINTS_PER_LIST training vectors per list
+MIN_POINTS_PER_LIST = 39
+# Vectors sampled to train IVF centroids, PQ codebooks and int8 ranges
+MAX_TRAIN_POINTS = 100000
+# PQ sub-quantizers (must divide the dimension) and bits per code
+PQ_M = 64
+PQ_NBITS = 8
+# HNSW neighbours per node and build-time search depth
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+# Query-time defaults, override with FAISS_NPROBE / FAISS_EF_SEARCH or per
+# tool in rag_tools.json
+NPROBE = int(os.environ.get("FAISS_NPROBE", 16))
+EF_SEARCH = int(os.environ.get("FAISS_EF_SEARCH", 64))
+
+
+def default_nlist(n):
+    return int(max(1, min(4 * np.sqrt(n), n // MIN_POINTS_PER_LIST)))
+
+
+def build_ann_index(vectors, index_type="flat", nlist=None, pq_m=PQ_M, hnsw_m=HNSW_M, seed=0):
+    """
+    Purpose:
+        Build a FAISS index of the given type over a set of vectors,
+        training it on a random sample when the type needs training
+    Args:
+        vectors: float32 array of embeddings, one row per chunk
+        index_type: one of INDEX_TYPES
+        nlist: IVF lists, defaults to default_nlist(n)
+        pq_m: PQ sub-quantizers, reduced to a divisor of the dimension
+        hnsw_m: HNSW neighbours per node
+        seed: seed of the training sample
+    Returns:
+        FAISS index holding every vector, with ids in row order
+    """
+    faiss = dependable_faiss_import()
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif index_type == "sq_fp16":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16)
+    elif index_type == "sq_int8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit)
+    elif index_type in ("ivf_flat", "ivf_pq", "pq"):
+        while dim % pq_m:
+            pq_m -= 1
+        # Small corpora cannot train 256 centroids per sub-quantizer
+        nbits = int(min(PQ_NBITS, max(1, np.log2(max(2, n // MIN_POINTS_PER_LIST)))))
+        if index_type == "pq":
+            index = faiss.IndexPQ(dim, pq_m, nbits)
+        else:
+            nlist = nlist or default_nlist(n)
+            codes = "Flat" if index_type == "ivf_flat" else f"PQ{pq_m}x{nbits}"
+            index = faiss.index_factory(dim, f"IVF{nlist},{codes}")
+    else:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+    if not index.is_trained:
+        sample = vectors
+        if n > MAX_TRAIN_POINTS:
+            rows = np.random.RandomState(seed).choice(n, MAX_TRAIN_POINTS, replace=False)
+            sample = vectors[rows]
+        print(f"Training {index_type} index on {len(sample)} vectors")
+        index.train(sample)
+    index.add(vectors)
+    return index
+
+
+def index_type_of(index):
+    """
+    Purpose:
+        Name the type of a FAISS index
+    Args:
+        index: FAISS index
+    Returns:
+        One of INDEX_TYPES, or the FAISS class name for anything else
+    """
+    faiss = dependable_faiss_import()
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVFFlat):
+        return "ivf_flat"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "sq_fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq_int8"
+    if isinstance(index, faiss.IndexPQ):
+        return "pq"
+    if isinstance(index, faiss.IndexFlat):
+        return "flat"
+    return type(index).__name__
+
+
+def set_search_params(index, nprobe=NPROBE, ef_search=EF_SEARCH) -> None:
+    """
+    Purpose:
+        Set the query-time accuracy/speed knobs of an approximate index;
+        flat indexes are left alone
+    Args:
+        index: FAISS index
+        nprobe: IVF lists scanned per query
+        ef_search: HNSW candidate list size per query
+    Returns:
+        N/A
+    """
+    faiss = dependable_faiss_import()
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = nprobe
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+
+
+def full_vectors(db, save_loc=None):
+    """
+    Purpose:
+        Return the full-precision vectors of a vector store, in index order
+    Args:
+        db: FAISS vector store
+        save_loc: directory the store was loaded from, checked for
+            VECTORS_FILE
+    Returns:
+        float32 array of vectors
+    """
+    if save_loc is not None:
+        path = os.path.join(store_dir(save_loc), VECTORS_FILE)
+        if os.path.exists(path):
+            vectors = np.load(path)
+            if len(vectors) == db.index.ntotal:
+                return vectors
+            print(f"Ignoring {path}: {len(vectors)} rows for {db.index.ntotal} vectors")
+    faiss = dependable_faiss_import()
+    index = faiss.downcast_index(db.index)
+    if isinstance(index, faiss.IndexIVF):
+        # Only exact for IVF-Flat, PQ codes decode to approximations
+        index.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def save_vectorstore(db, save_loc, index_type="flat", vectors=None) -> None:
+    """
+    Purpose:
+        Save a vector store with the requested index type. Approximate
+        indexes are built from the full-precision vectors, which are kept
+        in VECTORS_FILE next to the index
+    Args:
+        db: FAISS vector store
+        save_loc: local_index_* directory
+        index_type: one of INDEX_TYPES
+        vectors: full-precision vectors in index order, reconstructed from
+            db if None (exact only when db holds a flat index)
+    Returns:
+        N/A
+    """
+    if index_type != "flat" or index_type_of(db.index) != "flat":
+        if vectors is None:
+            vectors = full_vectors(db)
+        db.index = build_ann_index(vectors, index_type)
+    # Saved with the index, so the two are always from the same build
+    save_store(db, save_loc, vectors=None if index_type == "flat" else vectors)
+
+
+def _search_timed(index, queries, k, exact_vectors=None, rerank=1):
+    start = time.perf_counter()
+    _, ids = index.search(queries, k * rerank)
+    if rerank > 1:
+        ids = [
+            rerank_rows(exact_vectors, query, [int(j) for j in row if j != -1], k) for query, row in zip(queries, ids)
+        ]
+    return ids, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def recall_latency_report(
+    vectors,
+    k=4,
+    n_queries=200,
+    index_types=INDEX_TYPES,
+    nprobe_values=(1, 4, 16, 64),
+    ef_values=(16, 64, 256),
+    rerank=RERANK_FACTOR,
+    seed=0,
+):
+    """
+    Purpose:
+        Compare index types on recall@k against exact search, query latency
+        and memory, using vectors held out from the corpus as queries.
+        Compressed types are measured with and without re-ranking
+    Args:
+        vectors: float32 array of the corpus vectors
+        k: neighbours per query
+        n_queries: vectors held out as queries
+        index_types: index types to compare
+        nprobe_values: IVF nprobe settings to try
+        ef_values: HNSW efSearch settings to try
+        rerank: candidates per result re-ranked against full-precision
+            vectors for compressed types
+        seed: seed of the held-out sample
+    Returns:
+        List of dicts with index_type, param, recall, ms_per_query, bytes
+        and saved (fraction of the flat index size)
+    """
+    faiss = dependable_faiss_import()
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    rows = np.random.RandomState(seed).permutation(len(vectors))
+    n_queries = min(n_queries, len(vectors) // 10 or 1)
+    queries = vectors[rows[:n_queries]]
+    corpus = vectors[rows[n_queries:]]
+
+    flat = build_ann_index(corpus, "flat")
+    flat_bytes = faiss.serialize_index(flat).nbytes
+    truth, flat_ms = _search_timed(flat, queries, k)
+    results = [
+        {"index_type": "flat", "param": "", "recall": 1.0, "ms_per_query": flat_ms, "bytes": flat_bytes, "saved": 0.0}
+    ]
+    for index_type in index_types:
+        if index_type == "flat":
+            continue
+        index = build_ann_index(corpus, index_type)
+        size = faiss.serialize_index(index).nbytes
+        if index_type == "hnsw":
+            settings = [(f"efSearch={ef}", {"ef_search": ef}) for ef in ef_values]
+        elif index_type.startswith("ivf"):
+            settings = [(f"nprobe={nprobe}", {"nprobe": nprobe}) for nprobe in nprobe_values]
+        else:
+            settings = [("", {})]
+        rerank_values = [1, rerank] if is_lossy(index) and rerank > 1 else [1]
+        for param, kwargs in settings:
+            set_search_params(index, **kwargs)
+            for factor in rerank_values:
+                ids, ms = _search_timed(index, queries, k, corpus, factor)
+                recall = np.mean([len(set(ids[i]) & set(truth[i])) / k for i in range(n_queries)])
+                label = " ".join(part for part in (param, f"rerank x{factor}" if factor > 1 else "") if part)
+                results.append(
+                    {
+                        "index_type": index_type,
+                        "param": label,
+                        "recall": recall,
+                        "ms_per_query": ms,
+                        "bytes": size,
+                        "saved": 1 - size / flat_bytes,
+                    }
+                )
+
+    print(f"{len(corpus)} vectors, {n_queries} held-out queries, recall@{k} against flat search")
+    print(f"{'index':<10}{'setting':<24}{'recall':>8}{'ms/query':>10}{'MB':>10}{'saved':>8}")
+    for row in results:
+        print(
+            f"{row['index_type']:<10}{row['param']:<24}{row['recall']:>8.3f}"
+            f"{row['ms_per_query']:>10.3f}{row['bytes'] / 1024 ** 2:>10.1f}{row['saved']:>8.0%}"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall, latency and memory of index types for a saved corpus")
+    parser.add_argument("index_path", help="local_index_* directory")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    # Only the vectors are needed, queries are never embedded
+    db = load_store(args.index_path, None, mmap=False)
+    recall_latency_report(full_vectors(db, args.index_path), k=args.k, n_queries=args.queries)
@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+# Minimum cosine similarity between two queries for an answer to be reused
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", 0.95))
+# Seconds an answer stays reusable
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", 3600))
+# Answers kept per corpus, oldest are dropped first
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", 1000))
+# Set ANSWER_CACHE_ENABLED=0 to bypass the cache for every query
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "1") != "0"
+
+
+class SemanticAnswerCache:
+    """
+    Reuses generated answers for queries that are close to a query already
+    answered from the same corpus. Entries are matched by cosine similarity
+    of the query embeddings, expire after ttl seconds and are dropped when
+    the corpus index version changes.
+    """
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_SIZE):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._corpora = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _live_entries(self, corpus, version):
+        now = time.time()
+        entries = [
+            entry
+            for entry in self._corpora.get(corpus, [])
+            if entry["version"] == version and now - entry["created"] < self.ttl
+        ]
+        self._corpora[corpus] = entries
+        return entries
+
+    def lookup(self, corpus, query_vector, language=None, version=None):
+        """
+        Purpose:
+            Find a cached answer for a query similar to query_vector
+        Args:
+            corpus: tool name the answer was generated for
+            query_vector: embedding of the incoming query
+            language: translation language the answer was produced in
+            version: current index version, entries from other versions are stale
+        Returns:
+            Cached {"ans", "docs"} payload, or None
+        """
+        query = self._unit(query_vector)
+        with self._lock:
+            entries = [
+                entry for entry in self._live_entries(corpus, version) if entry["language"] == language
+            ]
+            if entries:
+                scores = np.stack([entry["vector"] for entry in entries]) @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.hits += 1
+                    print(f"answer cache hit ({scores[best]:.3f}): {entries[best]['query']}")
+                    return dict(entries[best]["payload"])
+            self.misses += 1
+        return None
+
+    def store(self, corpus, query, query_vector, payload, language=None, version=None):
+        """
+        Purpose:
+            Remember the answer generated for a query
+        Args:
+            corpus: tool name the answer was generated for
+            query: query text, kept for logging
+            query_vector: embedding of the query
+            payload: {"ans", "docs"} answer returned by the tool
+            language: translation language the answer was produced in
+            version: index version the answer was generated from
+        Returns:
+            N/A
+        """
+        entry = {
+            "query": query,
+            "vector": self._unit(query_vector),
+            "payload": dict(payload),
+            "language": language,
+            "version": version,
+            "created": time.time(),
+        }
+        with self._lock:
+            entries = self._live_entries(corpus, version)
+            entries.append(entry)
+            del entries[: -self.max_entries]
+
+    def invalidate(self, corpus=None):
+        """
+        Purpose:
+            Drop cached answers, e.g. after a corpus index is rebuilt
+        Args:
+            corpus: tool name to clear, or None to clear every corpus
+        Returns:
+            N/A
+        """
+        with self._lock:
+            if corpus is None:
+                self._corpora.clear()
+            else:
+                self._corpora.pop(corpus, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": sum(len(entries) for entries in self._corpora.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# Shared by every tool in the process
+answer_cache = SemanticAnswerCache()
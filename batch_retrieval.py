@@ -0,0 +1,68 @@
+import argparse
+import json
+import time
+
+from bedrock_tools import get_embeddings, load_tool_registry
+from embedding_pipeline import EMBED_MAX_WORKERS, EMBED_REQUESTS_PER_SECOND, embed_texts_concurrently
+
+
+def batch_retrieve(
+    queries,
+    label,
+    k=None,
+    max_workers=EMBED_MAX_WORKERS,
+    requests_per_second=EMBED_REQUESTS_PER_SECOND,
+    tools=None,
+):
+    """
+    Purpose:
+        Retrieve chunks for many queries from one corpus: the queries are
+        embedded concurrently under the ingest rate limits, then searched
+        with a single FAISS search over the query matrix
+    Args:
+        queries: list of question texts
+        label: tool label of the corpus
+        k: chunks per query, the tool's k if None
+        max_workers: upper bound on embedding requests in flight
+        requests_per_second: embedding request rate
+        tools: dict of label -> RagTool, the tool registry if None
+    Returns:
+        List with the list of Documents of each query, nearest first;
+        queries that could not be embedded get an empty list
+    """
+    tools = tools if tools is not None else load_tool_registry()
+    tool = tools[label]
+    start = time.perf_counter()
+    vectors, failed = embed_texts_concurrently(
+        queries, get_embeddings(), max_workers, requests_per_second, query=True
+    )
+    embedded = time.perf_counter()
+    results = tool.retrieve_batch(vectors, k) if vectors.size else [[] for _ in queries]
+    for i in failed:
+        results[i] = []
+    done = time.perf_counter()
+
+    total = done - start
+    print(
+        f"Retrieved {len(queries)} queries from {label} in {total:.2f}s "
+        f"({len(queries) / total if total else 0:.1f} queries/s; embedding {embedded - start:.2f}s, "
+        f"search {done - embedded:.3f}s, {len(failed)} failed)"
+    )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrieve chunks for a file of queries, one per line")
+    parser.add_argument("label", help="tool label of the corpus")
+    parser.add_argument("queries", help="text file with one query per line")
+    parser.add_argument("--k", type=int)
+    parser.add_argument("--out", default="retrieval.jsonl", help="JSON lines with each query and its sources")
+    args = parser.parse_args()
+    with open(args.queries) as f:
+        queries = [line.strip() for line in f if line.strip()]
+    results = batch_retrieve(queries, args.label, args.k)
+    with open(args.out, "w") as f:
+        for query, docs in zip(queries, results):
+            record = {"query": query, "sources": [doc.metadata.get("source") for doc in docs]}
+            f.write(json.dumps(record) + "\n")
+    print(f"Wrote {args.out}")
@@ -0,0 +1,261 @@
+import asyncio
+import functools
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+from langchain.embeddings import BedrockEmbeddings
+
+# Connection settings of the shared Bedrock client, overridable by
+# environment variables. Point BEDROCK_ENDPOINT_URL at a local mock to test
+# without AWS; an empty value uses the SDK's default endpoint
+BEDROCK_SERVICE_NAME = os.environ.get("BEDROCK_SERVICE_NAME", "bedrock")
+BEDROCK_REGION = os.environ.get("BEDROCK_REGION", "us-east-1")
+BEDROCK_ENDPOINT_URL = os.environ.get("BEDROCK_ENDPOINT_URL", "https://bedrock.us-east-1.amazonaws.com") or None
+BEDROCK_PROFILE = os.environ.get("BEDROCK_PROFILE") or None
+# Pooled keep-alive connections; also the number of calls the async API
+# runs at once
+BEDROCK_MAX_POOL_CONNECTIONS = int(os.environ.get("BEDROCK_MAX_POOL_CONNECTIONS", 50))
+BEDROCK_CONNECT_TIMEOUT = float(os.environ.get("BEDROCK_CONNECT_TIMEOUT", 5))
+# Long answers take a while before the first byte when not streamed
+BEDROCK_READ_TIMEOUT = float(os.environ.get("BEDROCK_READ_TIMEOUT", 120))
+# Attempts per call, including the first; adaptive mode also rate limits
+# the client when Bedrock throttles
+BEDROCK_MAX_ATTEMPTS = int(os.environ.get("BEDROCK_MAX_ATTEMPTS", 5))
+BEDROCK_RETRY_MODE = os.environ.get("BEDROCK_RETRY_MODE", "adaptive")
+# The ingest pipeline retries, backs off and lowers its concurrency itself
+# (embedding_pipeline.py), which it can only do if botocore hands every
+# throttled call straight back to it
+INGEST_MAX_ATTEMPTS = 1
+# Set BEDROCK_STUB=1 to run without AWS (see bedrock_stub.py)
+BEDROCK_STUB = os.environ.get("BEDROCK_STUB") == "1"
+
+TEXT_MODEL_ID = "amazon.titan-tg1-large"
+EMBEDDING_MODEL_ID = "amazon.titan-e1t-medium"
+
+_clients = {}
+_client_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=BEDROCK_MAX_POOL_CONNECTIONS, thread_name_prefix="bedrock")
+
+
+def client_config(max_attempts=BEDROCK_MAX_ATTEMPTS):
+    # Adaptive mode would still rate limit a single attempt client side
+    mode = BEDROCK_RETRY_MODE if max_attempts > 1 else "standard"
+    return Config(
+        region_name=BEDROCK_REGION,
+        connect_timeout=BEDROCK_CONNECT_TIMEOUT,
+        read_timeout=BEDROCK_READ_TIMEOUT,
+        max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        retries={"total_max_attempts": max_attempts, "mode": mode},
+    )
+
+
+def get_client(max_attempts=BEDROCK_MAX_ATTEMPTS):
+    """
+    Purpose:
+        Return the Bedrock client shared by the whole process. boto3
+        clients are thread safe, so one pooled client serves every tool,
+        embedding worker and Streamlit session
+    Args:
+        max_attempts: attempts per call; each value gets its own shared
+            client
+    Returns:
+        boto3 Bedrock client, or the stub client if BEDROCK_STUB=1
+    """
+    with _client_lock:
+        if max_attempts not in _clients:
+            if BEDROCK_STUB:
+                from bedrock_stub import StubBedrockClient
+
+                _clients[max_attempts] = StubBedrockClient()
+            else:
+                session = boto3.session.Session(profile_name=BEDROCK_PROFILE)
+                _clients[max_attempts] = session.client(
+                    service_name=BEDROCK_SERVICE_NAME,
+                    endpoint_url=BEDROCK_ENDPOINT_URL,
+                    config=client_config(max_attempts),
+                )
+        return _clients[max_attempts]
+
+
+def bedrock_embeddings(model_id=EMBEDDING_MODEL_ID, max_attempts=BEDROCK_MAX_ATTEMPTS):
+    """
+    Purpose:
+        LangChain embeddings on the shared client, for ingest and retrieval
+    Args:
+        model_id: Bedrock embedding model
+        max_attempts: attempts per call made by botocore; INGEST_MAX_ATTEMPTS
+            when the caller retries through embedding_pipeline
+    Returns:
+        BedrockEmbeddings
+    """
+    return BedrockEmbeddings(client=get_client(max_attempts), model_id=model_id)
+
+
+def titan_request(prompt, max_token_count=4096):
+    prompt_config = {
+        "inputText": prompt,
+        "textGenerationConfig": {
+            "maxTokenCount": max_token_count,
+            "stopSequences": [],
+            "temperature": 0.5,
+            "topP": 0.2,
+        },
+    }
+    return json.dumps(prompt_config)
+
+
+def invoke_text(prompt, model_id=TEXT_MODEL_ID, max_token_count=4096):
+    """
+    Purpose:
+        Generate text with a Titan text model
+    Args:
+        prompt: input text
+        model_id: Bedrock text model
+        max_token_count: tokens generated at most
+    Returns:
+        Generated text
+    """
+    response = get_client().invoke_model(
+        body=titan_request(prompt, max_token_count),
+        modelId=model_id,
+        accept="application/json",
+        contentType="application/json",
+    )
+    response_body = json.loads(response.get("body").read())
+    return response_body.get("results")[0].get("outputText")
+
+
+def stream_text(prompt, model_id=TEXT_MODEL_ID, max_token_count=4096):
+    """
+    Purpose:
+        Generate text with invoke_model_with_response_stream, yielding it
+        as the model produces it
+    Args:
+        prompt: input text
+        model_id: Bedrock text model
+        max_token_count: tokens generated at most
+    Returns:
+        Generator of text chunks
+    """
+    response = get_client().invoke_model_with_response_stream(
+        body=titan_request(prompt, max_token_count),
+        modelId=model_id,
+        accept="application/json",
+        contentType="application/json",
+    )
+    for event in response.get("body"):
+        if "chunk" not in event:
+            # Exceptions raised mid-stream arrive as events
+            raise RuntimeError(f"Bedrock stream failed: {event}")
+        text = json.loads(event["chunk"]["bytes"]).get("outputText")
+        if text:
+            yield text
+
+
+def embed_text(text, model_id=EMBEDDING_MODEL_ID):
+    """
+    Purpose:
+        Embed one text with a Titan embedding model
+    Args:
+        text: string to embed
+        model_id: Bedrock embedding model
+    Returns:
+        Embedding vector as a list of floats
+    """
+    response = get_client().invoke_model(
+        body=json.dumps({"inputText": text.replace("\n", " ")}),
+        modelId=model_id,
+        accept="application/json",
+        contentType="application/json",
+    )
+    return json.loads(response.get("body").read()).get("embedding")
+
+
+async def _run(fn, *args, **kwargs):
+    # botocore is blocking; calls run on a pool sized to the connection pool
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+
+async def ainvoke_text(prompt, model_id=TEXT_MODEL_ID, max_token_count=4096):
+    return await _run(invoke_text, prompt, model_id, max_token_count)
+
+
+async def aembed_text(text, model_id=EMBEDDING_MODEL_ID):
+    return await _run(embed_text, text, model_id)
+
+
+async def astream_text(prompt, model_id=TEXT_MODEL_ID, max_token_count=4096):
+    """
+    Purpose:
+        Async version of stream_text
+    Args:
+        prompt: input text
+        model_id: Bedrock text model
+        max_token_count: tokens generated at most
+    Returns:
+        Async generator of text chunks
+    """
+    chunks = stream_text(prompt, model_id, max_token_count)
+    done = object()
+    while True:
+        text = await _run(next, chunks, done)
+        if text is done:
+            return
+        yield text
+
+
+async def _gather_bounded(calls, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(call):
+        async with semaphore:
+            return await call
+
+    return await asyncio.gather(*(bounded(call) for call in calls))
+
+
+async def aembed_many(texts, model_id=EMBEDDING_MODEL_ID, concurrency=BEDROCK_MAX_POOL_CONNECTIONS):
+    """
+    Purpose:
+        Embed many texts concurrently
+    Args:
+        texts: list of strings
+        model_id: Bedrock embedding model
+        concurrency: calls in flight at most
+    Returns:
+        List of embedding vectors, in the order of texts
+    """
+    return await _gather_bounded([aembed_text(text, model_id) for text in texts], concurrency)
+
+
+async def ainvoke_many(
+    prompts, model_id=TEXT_MODEL_ID, max_token_count=4096, concurrency=BEDROCK_MAX_POOL_CONNECTIONS
+):
+    """
+    Purpose:
+        Generate text for many prompts concurrently
+    Args:
+        prompts: list of input texts
+        model_id: Bedrock text model
+        max_token_count: tokens generated at most per prompt
+        concurrency: calls in flight at most
+    Returns:
+        List of generated texts, in the order of prompts
+    """
+    calls = [ainvoke_text(prompt, model_id, max_token_count) for prompt in prompts]
+    return await _gather_bounded(calls, concurrency)
+
+
+def embed_many(texts, model_id=EMBEDDING_MODEL_ID, concurrency=BEDROCK_MAX_POOL_CONNECTIONS):
+    # For synchronous callers; not usable from inside a running event loop
+    return asyncio.run(aembed_many(texts, model_id, concurrency))
+
+
+def invoke_many(prompts, model_id=TEXT_MODEL_ID, max_token_count=4096, concurrency=BEDROCK_MAX_POOL_CONNECTIONS):
+    return asyncio.run(ainvoke_many(prompts, model_id, max_token_count, concurrency))
@@ -0,0 +1,48 @@
+import hashlib
+import io
+import json
+import time
+
+# Seconds between streamed chunks, to make progressive rendering visible
+STUB_CHUNK_DELAY = 0.05
+STUB_EMBEDDING_SIZE = 1536
+
+
+class StubBedrockClient:
+    """
+    Stand-in for the bedrock runtime client, used when BEDROCK_STUB=1 so
+    the tools and the Streamlit app run without AWS. Embeddings are derived
+    from a hash of the text and generation echoes the end of the prompt,
+    streamed word by word in the event format of
+    invoke_model_with_response_stream.
+    """
+
+    def __init__(self, chunk_delay=STUB_CHUNK_DELAY):
+        self.chunk_delay = chunk_delay
+
+    @staticmethod
+    def _answer(body):
+        prompt = json.loads(body)["inputText"]
+        return "Stub answer to: " + " ".join(prompt.split()[-40:])
+
+    def invoke_model(self, body, modelId, accept, contentType):
+        request = json.loads(body)
+        if "textGenerationConfig" in request:
+            response = {"results": [{"outputText": self._answer(body)}]}
+        else:
+            digest = hashlib.sha256(request["inputText"].encode("utf-8")).digest()
+            seed = digest * (STUB_EMBEDDING_SIZE // len(digest) + 1)
+            response = {"embedding": [b / 255 - 0.5 for b in seed[:STUB_EMBEDDING_SIZE]]}
+        return {"body": io.BytesIO(json.dumps(response).encode("utf-8"))}
+
+    def _events(self, body):
+        words = self._answer(body).split(" ")
+        for i, word in enumerate(words):
+            time.sleep(self.chunk_delay)
+            chunk = {"outputText": word + (" " if i < len(words) - 1 else ""), "index": 0}
+            if i == len(words) - 1:
+                chunk["completionReason"] = "FINISH"
+            yield {"chunk": {"bytes": json.dumps(chunk).encode("utf-8")}}
+
+    def invoke_model_with_response_stream(self, body, modelId, accept, contentType):
+        return {"body": self._events(body)}
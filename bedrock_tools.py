@@ -1,20 +1,33 @@
 import json
 
-import boto3
-from langchain.embeddings import BedrockEmbeddings
-from langchain.vectorstores import FAISS
+from bedrock_client import bedrock_embeddings, invoke_text, stream_text
+from embedding_cache import CachedEmbeddings, normalize_query
+from answer_cache import ANSWER_CACHE_ENABLED, answer_cache
+from ann_index import EF_SEARCH, NPROBE, set_search_params
+from context_builder import (
+    CANDIDATE_FACTOR,
+    CONTEXT_TOKEN_BUDGET,
+    CROSS_ENCODER_MODEL,
+    MMR_LAMBDA,
+    build_context,
+    get_cross_encoder,
+)
+from index_cache import index_signature, load_index
+from single_flight import SharedStream, request_coalescer
+from translation import translate_answer
+from vector_store import (
+    RERANK_FACTOR,
+    documents_for_rows,
+    hybrid_rows,
+    nearest_rows,
+    row_vectors,
+    search_batch,
+    search_with_scores,
+)
 from transformers import Tool
 import os
+import threading
 import pinecone
-import ai21
-
-ai21.api_key = os.environ.get('AI21_API_KEY')
-
-bedrock = boto3.client(
-    service_name="bedrock",
-    region_name="us-east-1",
-    endpoint_url="https://bedrock.us-east-1.amazonaws.com",
-)
 
 # get api key from app.pinecone.io
 PINECONE_API_KEY = os.environ.get('PINECONE_API_KEY') 
@@ -26,462 +39,276 @@ pinecone.init(
     environment=PINECONE_ENV
 )
 
-def call_ai21(prompt):
-    response = ai21.Completion.execute(
-    model='j1-large',
-    prompt=prompt,
-    temperature=0.65,
-    minTokens=4,
-    maxTokens=32,
-    numResults=1
-)
-    return response
-
-def call_bedrock(prompt):
-    prompt_config = {
-        "inputText": prompt,
-        "textGenerationConfig": {
-            "maxTokenCount": 4096,
-            "stopSequences": [],
-            "temperature": 0.5,
-            "topP": 0.2,
-        },
-    }
-
-    body = json.dumps(prompt_config)
-
-    modelId = "amazon.titan-tg1-large" #"ai21.j2-ultra" 
-    accept = "application/json"
-    contentType = "application/json"
-
-    response = bedrock.invoke_model(
-        body=body, modelId=modelId, accept=accept, contentType=contentType
-    )
-    response_body = json.loads(response.get("body").read())
-
-    results = response_body.get("results")[0].get("outputText")
-    return results
-
-
-class AWSWellArchTool(Tool):
-    name = "well_architected_tool"
-    description = "Use this tool for any AWS related question to help customers understand best practices on building on AWS. It will use the relevant context from the AWS Well-Architected Framework to answer the customer's query. The input is the customer's question. The tool returns an answer for the customer using the relevant context."
-    inputs = ["text"]
-    outputs = ["text"]
-
-    def __call__(self, query, translation_language):
-        # Find docs
-        embeddings = BedrockEmbeddings()
-        vectorstore = FAISS.load_local("local_index", embeddings)
-        docs = vectorstore.similarity_search(query)
-                
-        context = ""
-
-        doc_sources_string = ""
-        for doc in docs:
-            doc_sources_string += doc.metadata["source"] + "\n"
-            context += doc.page_content
-
-        prompt = f"""Use the following pieces of context to answer the question at the end. Give a very detailed, long answer.
+# Generation goes through the shared client in bedrock_client.py
+call_bedrock = invoke_text
+stream_bedrock = stream_text
 
-        {context}
 
-        Question: {query}
-        Answer:"""
-        # print prompt for log
-        print("prompt:\n")
-        print(prompt)
-        print("\nend of prompt\n")
-
-        generated_text = call_bedrock(prompt)
-        #print(generated_text)
-        #translate
-        if translation_language:
-            print("translating\n")
-            translation_prompt = generated_text 
-            try:
-                translated_text = call_ai21(translation_prompt)
-                resp_json = {"ans": str(translated_text['prompt']['text']), "docs": doc_sources_string}
-            except:
-                resp_json = "none"
-        else:
-            print("not translating\n")
-            resp_json = {"ans": str(generated_text), "docs": doc_sources_string}
-        return resp_json
-
-class MyelomaFoundationTool(Tool):
-    name = "myeloma_foundation_tool"
-    description = "Use this tool for any Myeloma Foundation related question to help customers understand best practices on building on AWS. It will use the relevant context from the AWS Well-Architected Framework to answer the customer's query. The input is the customer's question. The tool returns an answer for the customer using the relevant context."
-    inputs = ["text"]
-    outputs = ["text"]
-
-    def __call__(self, query, translation_language):
-        # Find docs
-        embeddings = BedrockEmbeddings()
-        vectorstore = FAISS.load_local("local_index_myeloma_foundation", embeddings)
-        docs = vectorstore.similarity_search(query)
-        
-        context = ""
-
-        doc_sources_string = ""
-        for doc in docs:
-            doc_sources_string += doc.metadata["source"] + "\n"
-            context += doc.page_content
-
-        prompt = f"""Use the following pieces of context to answer the question at the end. Give a very detailed, long answer.
+DEFAULT_PROMPT_TEMPLATE = """Use the following pieces of context to answer the question at the end. Give a very detailed, long answer.
 
         {context}
 
         Question: {query}
         Answer:"""
 
-        # print prompt for log
-        print("prompt:\n")
-        print(prompt)
-        print("\nend of prompt\n")
-
-        generated_text = call_bedrock(prompt)
-        #print(generated_text)
-        #translate
-        if translation_language:
-            print("translating\n")
-            translation_prompt = generated_text 
-            try:
-                translated_text = call_ai21(translation_prompt)
-                resp_json = {"ans": str(translated_text['prompt']['text']), "docs": doc_sources_string}
-            except:
-                resp_json = "none"
-        else:
-            print("not translating\n")
-            resp_json = {"ans": str(generated_text), "docs": doc_sources_string}
-        return resp_json
-class WhoWePlayForTool(Tool):
-    name = "who_we_play_for_tool"
-    description = "Use this tool for any Who We Play For related question to help customers understand best practices on building on AWS. It will use the relevant context from the AWS Well-Architected Framework to answer the customer's query. The input is the customer's question. The tool returns an answer for the customer using the relevant context."
-    inputs = ["text"]
-    outputs = ["text"]
-
-    def __call__(self, query, translation_language):
-        # Find docs
-        embeddings = BedrockEmbeddings()
-        vectorstore = FAISS.load_local("local_index_who_we_play_for", embeddings)
-        docs = vectorstore.similarity_search(query)
-        
-        context = ""
-
-        doc_sources_string = ""
-        for doc in docs:
-            doc_sources_string += doc.metadata["source"] + "\n"
-            context += doc.page_content
-
-        prompt = f"""Use the following pieces of context to answer the question at the end. Give a very detailed, long answer.
-
-        {context}
-
-        Question: {query}
-        Answer:"""
-
-        # print prompt for log
-        print("prompt:\n")
-        print(prompt)
-        print("\nend of prompt\n")
-
-        generated_text = call_bedrock(prompt)
-        #print(generated_text)
-        #translate
-        if translation_language:
-            print("translating\n")
-            translation_prompt = generated_text 
-            try:
-                translated_text = call_ai21(translation_prompt)
-                resp_json = {"ans": str(translated_text['prompt']['text']), "docs": doc_sources_string}
-            except:
-                resp_json = "none"
-        else:
-            print("not translating\n")
-            resp_json = {"ans": str(generated_text), "docs": doc_sources_string} 
-        return resp_json
-
-class BroadviewFCUTool(Tool):
-    name = "broadview_tool"
-    description = "Use this tool for any Broadview FCU related question to help customers understand best practices on building on AWS. It will use the relevant context from the AWS Well-Architected Framework to answer the customer's query. The input is the customer's question. The tool returns an answer for the customer using the relevant context."
-    inputs = ["text"]
-    outputs = ["text"]
-
-    def __call__(self, query, translation_language):
-        # Find docs
-        embeddings = BedrockEmbeddings()
-        vectorstore = FAISS.load_local("local_index_broadview_fcu", embeddings)
-        docs = vectorstore.similarity_search(query)
-        
-        context = ""
-
-        doc_sources_string = ""
-        for doc in docs:
-            doc_sources_string += doc.metadata["source"] + "\n"
-            context += doc.page_content
-
-        prompt = f"""Use the following pieces of context to answer the question at the end. Give a very detailed, long answer.
-
-        {context}
-
-        Question: {query}
-        Answer:"""
-
-        # print prompt for log
-        print("prompt:\n")
-        print(prompt)
-        print("\nend of prompt\n")
-
-        generated_text = call_bedrock(prompt)
-        #print(generated_text)
-        #translate
-        if translation_language:
-            print("translating\n")
-            translation_prompt = generated_text 
-            try:
-                translated_text = call_ai21(translation_prompt)
-                resp_json = {"ans": str(translated_text['prompt']['text']), "docs": doc_sources_string}
-            except:
-                resp_json = "none"
-        else:
-            print("not translating\n")
-            resp_json = {"ans": str(generated_text), "docs": doc_sources_string}
-        return resp_json
-    
-class TEDTool(Tool):
-    name = "ted_tool"
-    description = "Use this tool for any TED related question to help customers understand best practices on building on AWS. It will use the relevant context from the AWS Well-Architected Framework to answer the customer's query. The input is the customer's question. The tool returns an answer for the customer using the relevant context."
-    inputs = ["text"]
-    outputs = ["text"]
-
-    def __call__(self, query, translation_language):
-        # Find docs
-        embeddings = BedrockEmbeddings()
-        vectorstore = FAISS.load_local("local_index_ted", embeddings)
-        docs = vectorstore.similarity_search(query)
-        
-        context = ""
-
-        doc_sources_string = ""
-        for doc in docs:
-            doc_sources_string += doc.metadata["source"] + "\n"
-            context += doc.page_content
-
-        prompt = f"""Use the following pieces of context to answer the question at the end. Give a very detailed, long answer.
-
-        {context}
+# Tool registry file, override with the RAG_TOOL_REGISTRY environment variable
+TOOL_REGISTRY_PATH = os.environ.get(
+    "RAG_TOOL_REGISTRY", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rag_tools.json")
+)
 
-        Question: {query}
-        Answer:"""
+# "dense" searches the vector index only, "hybrid" fuses it with BM25;
+# override with RAG_RETRIEVAL or per tool in rag_tools.json
+RETRIEVAL_MODE = os.environ.get("RAG_RETRIEVAL", "dense")
+
+_embeddings = None
+
+
+def get_embeddings():
+    """
+    Purpose:
+        Return the embeddings client shared by every RAG tool, with
+        query vectors cached (see embedding_cache.py)
+    Args:
+        N/A
+    Returns:
+        CachedEmbeddings wrapping BedrockEmbeddings on the shared client
+    """
+    global _embeddings
+    if _embeddings is None:
+        _embeddings = CachedEmbeddings(bedrock_embeddings())
+    return _embeddings
+
+
+class RagTool(Tool):
+    """
+    Answers questions from one corpus: retrieves candidate chunks from the
+    corpus index, packs up to k of them into a token-budgeted context (see
+    context_builder.py), asks Bedrock to answer using it and optionally
+    translates the answer. Every corpus is an instance of this
+    class configured from the tool registry.
+    """
 
-        # print prompt for log
-        print("prompt:\n")
-        print(prompt)
-        print("\nend of prompt\n")
-        generated_text = call_bedrock(prompt)
-        # print(generated_text)
-        #translate
-        if translation_language:
-            print("translating\n")
-            translation_prompt = generated_text 
-            try:
-                translated_text = call_ai21(translation_prompt)
-                resp_json = {"ans": str(translated_text['prompt']['text']), "docs": doc_sources_string}
-            except:
-                resp_json = "none"
-        else:
-            print("not translating\n")
-            resp_json = {"ans": str(generated_text), "docs": doc_sources_string}
-        return resp_json
-
-class GettrTool(Tool):
-    name = "gettr_tool"
-    description = "Use this tool for any Gettr related question to help customers understand best practices on building on AWS. It will use the relevant context from the AWS Well-Architected Framework to answer the customer's query. The input is the customer's question. The tool returns an answer for the customer using the relevant context."
     inputs = ["text"]
     outputs = ["text"]
 
-    def __call__(self, query, translation_language):
-        # Find docs
-        embeddings = BedrockEmbeddings()
-        vectorstore = FAISS.load_local("local_index_gettr", embeddings)
-        docs = vectorstore.similarity_search(query)
-        
-        context = ""
-
-        doc_sources_string = ""
-        for doc in docs:
-            doc_sources_string += doc.metadata["source"] + "\n"
-            context += doc.page_content
-
-        prompt = f"""Use the following pieces of context to answer the question at the end. Give a very detailed, long answer.
-
-        {context}
-
-        Question: {query}
-        Answer:"""
-
-        # print prompt for log
-        print("prompt:\n")
-        print(prompt)
-        print("\nend of prompt\n")
-
-        generated_text = call_bedrock(prompt)
-        #print(generated_text)
-        #translate
-        if translation_language:
-            print("translating\n")
-            translation_prompt = generated_text 
-            try:
-                translated_text = call_ai21(translation_prompt)
-                resp_json = {"ans": str(translated_text['prompt']['text']), "docs": doc_sources_string}
-            except:
-                resp_json = "none"
+    def __init__(
+        self,
+        name,
+        description,
+        index_path,
+        label=None,
+        k=4,
+        prompt_template=DEFAULT_PROMPT_TEMPLATE,
+        model_id="amazon.titan-tg1-large",
+        max_token_count=4096,
+        log_prompt=True,
+        nprobe=NPROBE,
+        ef_search=EF_SEARCH,
+        rerank=RERANK_FACTOR,
+        retrieval=RETRIEVAL_MODE,
+        context_token_budget=CONTEXT_TOKEN_BUDGET,
+        candidate_factor=CANDIDATE_FACTOR,
+        mmr_lambda=MMR_LAMBDA,
+        cross_encoder=CROSS_ENCODER_MODEL,
+    ):
+        super().__init__()
+        self.name = name
+        self.description = description
+        self.index_path = index_path
+        self.label = label or name
+        self.k = k
+        self.prompt_template = prompt_template
+        self.model_id = model_id
+        self.max_token_count = max_token_count
+        self.log_prompt = log_prompt
+        # Only used when the corpus has an IVF or HNSW index
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        # Only used when the corpus index stores compressed vectors
+        self.rerank = rerank
+        self.retrieval = retrieval
+        self.context_token_budget = context_token_budget
+        self.candidate_factor = candidate_factor
+        self.mmr_lambda = mmr_lambda
+        self.cross_encoder = cross_encoder
+
+    def vectorstore(self):
+        vectorstore = load_index(self.index_path, get_embeddings())
+        set_search_params(vectorstore.index, self.nprobe, self.ef_search)
+        return vectorstore
+
+    def retrieve_with_scores(self, query_vector, k=None):
+        # Only the k hits are read from the docstore
+        return search_with_scores(self.vectorstore(), query_vector, k or self.k, self.rerank)
+
+    def retrieve_candidates(self, query_vector, query=None):
+        vectorstore = self.vectorstore()
+        fetch_k = self.k * self.candidate_factor
+        if self.retrieval == "hybrid" and query:
+            rows = hybrid_rows(vectorstore, query, query_vector, fetch_k, self.rerank)
         else:
-            print("not translating\n")
-            resp_json = {"ans": str(generated_text), "docs": doc_sources_string}
-        return resp_json
-    
-class CK_12Tool(Tool):
-    name = "ck_12_tool"
-    description = "Use this tool for any CK-12 related question to help customers understand best practices on building on AWS. It will use the relevant context from the AWS Well-Architected Framework to answer the customer's query. The input is the customer's question. The tool returns an answer for the customer using the relevant context."
-    inputs = ["text"]
-    outputs = ["text"]
-
-    def __call__(self, query, translation_language):
-        # Find docs
-        embeddings = BedrockEmbeddings()
-        vectorstore = FAISS.load_local("local_index_ck_12", embeddings)
-        docs = vectorstore.similarity_search(query)
-        
-        context = ""
+            rows = [row for row, _ in nearest_rows(vectorstore, query_vector, fetch_k, self.rerank)]
+        return documents_for_rows(vectorstore, rows), row_vectors(vectorstore, rows)
+
+    def retrieve_batch(self, query_vectors, k=None):
+        # Vector search only, in one FAISS call for every query
+        return search_batch(self.vectorstore(), query_vectors, k or self.k, self.rerank)
+
+    def build_prompt(self, query, query_vector):
+        # Find candidates and pack the best of them into the context
+        candidates, vectors = self.retrieve_candidates(query_vector, query)
+        context, docs = build_context(
+            query,
+            query_vector,
+            candidates,
+            vectors,
+            self.k,
+            self.context_token_budget,
+            self.mmr_lambda,
+            get_cross_encoder(self.cross_encoder),
+        )
 
         doc_sources_string = ""
         for doc in docs:
             doc_sources_string += doc.metadata["source"] + "\n"
-            context += doc.page_content
 
-        prompt = f"""Use the following pieces of context to answer the question at the end. Give a very detailed, long answer.
-
-        {context}
-
-        Question: {query}
-        Answer:"""
+        prompt = self.prompt_template.format(context=context, query=query)
 
         # print prompt for log
-        print("prompt:\n")
-        print(prompt)
-        print("\nend of prompt\n")
-
-        generated_text = call_bedrock(prompt)
-        #print(generated_text)
-        #translate
+        if self.log_prompt:
+            print("prompt:\n")
+            print(prompt)
+            print("\nend of prompt\n")
+        return prompt, doc_sources_string
+
+    def stream(self, query, use_cache=ANSWER_CACHE_ENABLED):
+        """
+        Purpose:
+            Answer a query in English, streaming the answer as Bedrock
+            generates it
+        Args:
+            query: question text
+            use_cache: look up and store the answer in the answer cache
+        Returns:
+            Tuple of (sources, one per line, iterable of answer text
+            chunks). Retrieval is done before this returns, so the sources
+            can be shown while the answer is generated. Identical queries
+            streamed at the same time share one retrieval and generation
+        """
+        key = ("stream", self.name, normalize_query(query))
+        return request_coalescer.do(key, lambda: self._start_stream(query, use_cache, key), hold=True)
+
+    def _start_stream(self, query, use_cache, key):
+        query_vector = get_embeddings().embed_query(query)
+        index_version = index_signature(self.index_path)
+
+        if use_cache:
+            cached = answer_cache.lookup(self.name, query_vector, False, index_version)
+            if cached is not None:
+                request_coalescer.release(key)
+                return cached["docs"], [cached["ans"]]
+
+        prompt, doc_sources_string = self.build_prompt(query, query_vector)
+
+        def generate():
+            parts = []
+            for text in stream_bedrock(prompt, self.model_id, self.max_token_count):
+                parts.append(text)
+                yield text
+            # Only complete answers are cached
+            if use_cache:
+                resp_json = {"ans": "".join(parts), "docs": doc_sources_string}
+                answer_cache.store(self.name, query, query_vector, resp_json, False, index_version)
+
+        # Later identical queries join the stream until it ends
+        return doc_sources_string, SharedStream(generate(), on_done=lambda: request_coalescer.release(key))
+
+    def __call__(self, query, translation_language, use_cache=ANSWER_CACHE_ENABLED):
+        # Concurrent identical requests share one retrieval and generation
+        key = (self.name, normalize_query(query), translation_language)
+        return request_coalescer.do(key, lambda: self._answer(query, translation_language, use_cache))
+
+    def _answer(self, query, translation_language, use_cache):
         if translation_language:
-            print("translating\n")
-            translation_prompt = generated_text 
-            try:
-                translated_text = call_ai21(translation_prompt)
-                resp_json = {"ans": str(translated_text['prompt']['text']), "docs": doc_sources_string}
-            except:
-                resp_json = "none"
-        else:
-            print("not translating\n")
-            resp_json = {"ans": str(generated_text), "docs": doc_sources_string}
-        return resp_json
-    
-class CFATool(Tool):
-    name = "cfa_tool"
-    description = "Use this tool for any CFA related question to help customers understand best practices on building on AWS. It will use the relevant context from the AWS Well-Architected Framework to answer the customer's query. The input is the customer's question. The tool returns an answer for the customer using the relevant context."
-    inputs = ["text"]
-    outputs = ["text"]
+            # The English answer is generated, coalesced and cached as for
+            # any other query; translations have their own cache
+            return translate_answer(self(query, False, use_cache), translation_language)
 
-    def __call__(self, query, translation_language):
-        # Find docs
-        embeddings = BedrockEmbeddings()
-        vectorstore = FAISS.load_local("local_index_cfa_institute", embeddings)
-        docs = vectorstore.similarity_search(query)
-        
-        context = ""
+        # Embed once, the vector is shared by the answer cache and the search
+        query_vector = get_embeddings().embed_query(query)
+        # Answers generated from an older build of the index are stale
+        index_version = index_signature(self.index_path)
 
-        doc_sources_string = ""
-        for doc in docs:
-            doc_sources_string += doc.metadata["source"] + "\n"
-            context += doc.page_content
-
-        prompt = f"""Use the following pieces of context to answer the question at the end. Give a very detailed, long answer.
-
-        {context}
+        if use_cache:
+            cached = answer_cache.lookup(self.name, query_vector, False, index_version)
+            if cached is not None:
+                return cached
 
-        Question: {query}
-        Answer:"""
+        prompt, doc_sources_string = self.build_prompt(query, query_vector)
 
-        # print prompt for log
-        print("prompt:\n")
-        print(prompt)
-        print("\nend of prompt\n")
+        generated_text = call_bedrock(prompt, self.model_id, self.max_token_count)
+        resp_json = {"ans": str(generated_text), "docs": doc_sources_string}
 
-        generated_text = call_bedrock(prompt)
-        #print(generated_text)
-        #translate
-        if translation_language:
-            print("translating\n")
-            translation_prompt = generated_text 
-            try:
-                translated_text = call_ai21(translation_prompt)
-                resp_json = {"ans": str(translated_text['prompt']['text']), "docs": doc_sources_string}
-            except:
-                resp_json = "none"
-        else:
-            print("not translating\n")
-            resp_json = {"ans": str(generated_text), "docs": doc_sources_string}
+        if use_cache:
+            answer_cache.store(self.name, query, query_vector, resp_json, False, index_version)
         return resp_json
-    
-class JehovasWitnessTool(Tool):
-    name = "jw_tool"
-    description = "Use this tool for any Jehova's Witness related question to help customers understand best practices on building on AWS. It will use the relevant context from the AWS Well-Architected Framework to answer the customer's query. The input is the customer's question. The tool returns an answer for the customer using the relevant context."
-    inputs = ["text"]
-    outputs = ["text"]
-
-    def __call__(self, query, translation_language):
-        # Find docs
-        embeddings = BedrockEmbeddings()
-        vectorstore = FAISS.load_local("local_index_jehovah_witness", embeddings)
-        docs = vectorstore.similarity_search(query)
-        
-        context = ""
-
-        doc_sources_string = ""
-        for doc in docs:
-            doc_sources_string += doc.metadata["source"] + "\n"
-            context += doc.page_content
-
-        prompt = f"""Use the following pieces of context to answer the question at the end. Give a very detailed, long answer.
 
-        {context}
 
-        Question: {query}
-        Answer:"""
-
-        # print prompt for log
-        #print("prompt:\n")
-        #print(prompt)
-        #print("\nend of prompt\n")
+# label -> RagTool, in registry order. The dict is replaced rather than
+# changed in place, so callers can iterate the one they were handed while
+# another session reloads the registry
+rag_tools = {}
+_registry_signature = None
+_registry_labels = set()
+_registry_lock = threading.Lock()
+
+
+def register_rag_tool(config):
+    """
+    Purpose:
+        Add or replace a corpus at runtime
+    Args:
+        config: dict of RagTool keyword arguments, at least name,
+            description and index_path
+    Returns:
+        The registered RagTool
+    """
+    global rag_tools
+    tool = RagTool(**config)
+    with _registry_lock:
+        rag_tools = {**rag_tools, tool.label: tool}
+    return tool
+
+
+def load_tool_registry(path=TOOL_REGISTRY_PATH):
+    """
+    Purpose:
+        (Re)load the corpora listed in the registry file if it changed
+    Args:
+        path: JSON file with a "tools" list of RagTool configs
+    Returns:
+        Dict of label -> RagTool
+    """
+    global rag_tools, _registry_signature, _registry_labels
+    stat = os.stat(path)
+    signature = (path, stat.st_mtime_ns, stat.st_size)
+    with _registry_lock:
+        if signature == _registry_signature:
+            return rag_tools
+
+        with open(path) as f:
+            registry = json.load(f)
+
+        # Tools registered from code with register_rag_tool survive a reload
+        tools = {label: tool for label, tool in rag_tools.items() if label not in _registry_labels}
+        labels = set()
+        for config in registry["tools"]:
+            tool = RagTool(**config)
+            tools[tool.label] = tool
+            labels.add(tool.label)
+        rag_tools, _registry_labels, _registry_signature = tools, labels, signature
+        return rag_tools
 
-        generated_text = call_bedrock(prompt)
-        #print(generated_text)
-        #translate
-        if translation_language:
-            print("translating\n")
-            translation_prompt = generated_text 
-            try:
-                translated_text = call_ai21(translation_prompt)
-                resp_json = {"ans": str(translated_text['prompt']['text']), "docs": doc_sources_string}
-            except:
-                resp_json = "none"
-        else:
-            print("not translating\n")
-            resp_json = {"ans": str(generated_text), "docs": doc_sources_string}
-        return resp_json
 
 class CodeGenerationTool(Tool):
     name = "code_generation_tool"
@@ -494,12 +321,16 @@ class CodeGenerationTool(Tool):
         generated_text = call_bedrock(prompt)
         return generated_text
 
+    def stream(self, prompt):
+        # Same shape as RagTool.stream, without sources
+        return "", stream_bedrock(prompt)
+
 
 
 #### Testing Well Architected Tool
 # query = "How can I design secure VPCs?"
-# well_arch_tool = AWSWellArchTool()
-# output = well_arch_tool(query)
+# well_arch_tool = load_tool_registry()["AWS Well Architected Tool"]
+# output = well_arch_tool(query, False)
 # print(output)
 
 
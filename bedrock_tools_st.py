@@ -1,64 +1,18 @@
-import json
 import sys
-import boto3
 from langchain.embeddings import BedrockEmbeddings
 from langchain.vectorstores import FAISS
 from transformers import Tool
 import streamlit as st
-from bedrock_tools import AWSWellArchTool, CodeGenerationTool, GettrTool, CK_12Tool, CFATool, JehovasWitnessTool, BroadviewFCUTool, TEDTool, MyelomaFoundationTool, WhoWePlayForTool
+from bedrock_tools import CodeGenerationTool, load_tool_registry
+from translation import translator
 
-well_arch_tool = AWSWellArchTool()
 code_gen_tool = CodeGenerationTool()
-gettr_tool = GettrTool()
-ck_12_tool = CK_12Tool()
-cfa_tool = CFATool()
-jw_tool = JehovasWitnessTool()
-broadview_tool = BroadviewFCUTool()
-ted_tool = TEDTool()
-myeloma_foundation_tool = MyelomaFoundationTool()
-who_we_play_for_tool = WhoWePlayForTool()
-
-
-bedrock = boto3.client(
-    service_name="bedrock",
-    region_name="us-east-1",
-    endpoint_url="https://bedrock.us-east-1.amazonaws.com",
-)
-
-
-def call_bedrock(prompt):
-    prompt_config = {
-        "inputText": prompt,
-        "textGenerationConfig": {
-            "maxTokenCount": 4096,
-            "stopSequences": [],
-            "temperature": 0.5,
-            "topP": 0.2,
-        },
-    }
-
-    body = json.dumps(prompt_config)
-
-    modelId = "amazon.titan-tg1-large" #"ai21.j2-ultra" 
-    accept = "application/json"
-    contentType = "application/json"
-
-    response = bedrock.invoke_model(
-        body=body, modelId=modelId, accept=accept, contentType=contentType
-    )
-    response_body = json.loads(response.get("body").read())
-
-    results = response_body.get("results")[0].get("outputText")
-    return results
-
-
-
 
 
 #### Testing Well Architected Tool
 #query = "How can I design secure VPCs?"
-#well_arch_tool = AWSWellArchTool()
-#output = well_arch_tool(query)
+#well_arch_tool = load_tool_registry()["AWS Well Architected Tool"]
+#output = well_arch_tool(query, False)
 #print(output)
 
 
@@ -68,6 +22,24 @@ def call_bedrock(prompt):
 # output = code_gen_tool(query)
 # print(output)
 
+def render_stream(chunks):
+    """
+    Purpose:
+        Render streamed text as it arrives
+    Args:
+        chunks: iterable of text chunks
+    Returns:
+        The full text
+    """
+    placeholder = st.empty()
+    text = ""
+    for chunk in chunks:
+        text += chunk
+        placeholder.markdown(text + "▌")
+    placeholder.markdown(text)
+    return text
+
+
 def app(multilingual) -> None:
     """
     Purpose:
@@ -78,51 +50,48 @@ def app(multilingual) -> None:
         N/A
     """
 
+    # Picks up corpora added to the registry file since the last run
+    rag_tools = load_tool_registry()
+    tool_labels = list(rag_tools)
+    tool_labels.insert(1, "Code Generation Tool")
+
     # Choose tool
     current_tool = st.selectbox(
-        "Choose Tool:", ["AWS Well Architected Tool", "Code Generation Tool", "Broadview FCU Q&A", "Myeloma Foundation Q&A", "TED Q&A", "Gettr Q&A", "CK-12 Q&A", "Jehova's Witness Q&A", "CFA Institute Q&A", "Who We Play For Q&A"]
+        "Choose Tool:", tool_labels
     )
 
     query = st.text_input("Query:")
 
-    #translation_language = st.selectbox(
-    #    "Choose Language:", ["English", "French", "Spanish", "German", "Dutch", "Italian", "Arabic", "Bengali", "Esperanto"]
-    #)
-    translation_language = multilingual
+    translation_language = None
+    if multilingual:
+        translation_language = st.selectbox(
+            "Choose Language:", ["English", "French", "Spanish", "German", "Dutch", "Italian", "Arabic", "Bengali", "Esperanto"]
+        )
+        if translation_language == "English":
+            translation_language = None
 
     if st.button("Submit Query"):
-        with st.spinner("Generating..."):
-            if current_tool == "AWS Well Architected Tool":
-                answer = well_arch_tool(query, translation_language)
-            elif current_tool == "Broadview FCU Q&A":
-                answer = broadview_tool(query, translation_language)
-            elif current_tool == "TED Q&A":
-                answer = ted_tool(query, translation_language)
-            elif current_tool == "Gettr Q&A":
-                answer = gettr_tool(query, translation_language)
-            elif current_tool == "CK-12 Q&A":
-                answer = ck_12_tool(query, translation_language)
-            elif current_tool == "Jehova's Witness Q&A":
-                answer = jw_tool(query, translation_language)
-            elif current_tool == "CFA Institute Q&A":
-                answer = cfa_tool(query, translation_language)
-            elif current_tool == "Myeloma Foundation Q&A":
-                answer = myeloma_foundation_tool(query, translation_language)
-            elif current_tool == "Who We Play For Q&A":
-                answer = who_we_play_for_tool(query, translation_language)
-            elif current_tool == "Code Generation Tool":
-                print("codegen")
-                answer = code_gen_tool(query, translation_language)
-
-            if type(answer) == dict:
-                st.markdown(answer["ans"])
-                docs = answer["docs"].split("\n")
-
-                with st.expander("Resources"):
-                    for doc in docs:
-                        st.write(doc)
-            else:
-                st.markdown(answer)
+        tool = code_gen_tool if current_tool == "Code Generation Tool" else rag_tools[current_tool]
+        # Stream the answer; sources are known before generation starts
+        with st.spinner("Searching..."):
+            sources, chunks = tool.stream(query)
+        if sources:
+            with st.expander("Resources"):
+                for doc in sources.split("\n"):
+                    st.write(doc)
+        english = render_stream(chunks)
+
+        # The English answer stays on screen while the translation runs
+        if translation_language and current_tool != "Code Generation Tool":
+            future = translator.submit(english, translation_language)
+            with st.spinner(f"Translating to {translation_language}..."):
+                try:
+                    translated = future.result()
+                except Exception as e:
+                    st.warning(f"Translation to {translation_language} failed: {e}")
+                else:
+                    st.subheader(translation_language)
+                    st.markdown(translated)
 
 
 def main(multilingual) -> None:
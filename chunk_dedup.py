@@ -0,0 +1,270 @@
+import hashlib
+import re
+import threading
+
+import numpy as np
+from langchain.docstore.document import Document
+
+# A text block seen on this many pages is boilerplate (nav, footer, cookie
+# banner) and is stripped from the pages that follow
+BOILERPLATE_MIN_PAGES = 3
+# Chunks whose shingle sets have an estimated Jaccard similarity of at
+# least this are near duplicates
+NEAR_DUP_THRESHOLD = 0.8
+# MinHash signature of MINHASH_BANDS bands of MINHASH_ROWS values; chunks
+# sharing any band are compared
+MINHASH_BANDS = 16
+MINHASH_ROWS = 4
+SHINGLE_SIZE = 3
+# Shorter chunks are only checked for exact duplicates
+MIN_NEAR_DUP_WORDS = 8
+
+_WORD = re.compile(r"\w+")
+_BLOCK_SPLIT = re.compile(r"\n\s*\n")
+
+
+def normalize_text(text):
+    return " ".join(text.split()).casefold()
+
+
+_DIGEST_SIZE = 8
+
+
+def _digest(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=_DIGEST_SIZE).digest()
+
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def _permutations(count, seed=1):
+    rng = np.random.RandomState(seed)
+    return (
+        rng.randint(1, 1 << 32, size=count, dtype=np.uint64),
+        rng.randint(0, 1 << 32, size=count, dtype=np.uint64),
+    )
+
+
+def minhash(words, permutations, shingle_size=SHINGLE_SIZE):
+    """
+    Purpose:
+        MinHash signature of the word shingles of a text
+    Args:
+        words: list of normalized words
+        permutations: (a, b) arrays of the hash permutations
+        shingle_size: words per shingle
+    Returns:
+        uint32 array with one value per permutation
+    """
+    shingles = {" ".join(words[i : i + shingle_size]) for i in range(max(1, len(words) - shingle_size + 1))}
+    hashes = np.frombuffer(b"".join(_digest(shingle)[:4] for shingle in shingles), dtype=np.uint32)
+    a, b = permutations
+    # uint64 arithmetic wraps, which is fine for hashing
+    values = (np.outer(hashes.astype(np.uint64), a) + b) % _MERSENNE_PRIME
+    return (values & np.uint64(0xFFFFFFFF)).astype(np.uint32).min(axis=0)
+
+
+class ChunkDeduplicator:
+    """
+    Drops chunks that would only repeat what is already indexed, before they
+    are embedded. Page text blocks that recur across pages are stripped,
+    then chunks are checked for exact duplicates (hash of the normalized
+    text) and near duplicates (MinHash, looked up through LSH bands).
+    """
+
+    def __init__(
+        self,
+        boilerplate_min_pages=BOILERPLATE_MIN_PAGES,
+        threshold=NEAR_DUP_THRESHOLD,
+        bands=MINHASH_BANDS,
+        rows=MINHASH_ROWS,
+    ):
+        self.boilerplate_min_pages = boilerplate_min_pages
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = rows
+        self._permutations = _permutations(bands * rows)
+        self._block_pages = {}
+        self._page_blocks = {}
+        self._hashes = set()
+        self._signatures = []
+        self._buckets = [{} for _ in range(bands)]
+        self._lock = threading.Lock()
+        self.pages = 0
+        self.blocks_stripped = 0
+        self.chunks = 0
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+
+    def strip_boilerplate(self, page, key=None):
+        """
+        Purpose:
+            Remove text blocks that already appeared on enough other pages
+        Args:
+            page: page Document
+            key: optional key of the page (its URL, or a document_key); the
+                page's blocks are recorded under it for boilerplate_state,
+                replacing what an earlier version of the page counted
+        Returns:
+            Document with the remaining blocks
+        """
+        blocks = _BLOCK_SPLIT.split(page.page_content)
+        kept = []
+        with self._lock:
+            self.pages += 1
+            if key is not None:
+                self._forget(key)
+            seen_on_page = set()
+            for block in blocks:
+                normalized = normalize_text(block)
+                if not normalized:
+                    continue
+                digest = _digest(normalized)
+                if digest not in seen_on_page:
+                    seen_on_page.add(digest)
+                    self._block_pages[digest] = self._block_pages.get(digest, 0) + 1
+                if self._block_pages[digest] > self.boilerplate_min_pages:
+                    self.blocks_stripped += 1
+                else:
+                    kept.append(block)
+            if key is not None:
+                self._page_blocks[key] = seen_on_page
+        return Document(page_content="\n\n".join(kept), metadata=page.metadata)
+
+    def _forget(self, key):
+        for block in self._page_blocks.pop(key, ()):
+            self._block_pages[block] -= 1
+            if not self._block_pages[block]:
+                del self._block_pages[block]
+
+    def forget(self, key) -> None:
+        """
+        Purpose:
+            Stop counting the blocks of a page that left the index
+        Args:
+            key: key the page was stripped under
+        Returns:
+            N/A
+        """
+        with self._lock:
+            self._forget(key)
+
+    def page_blocks(self, key):
+        """
+        Purpose:
+            Block digests of one page, as stored by boilerplate_state
+        Args:
+            key: key the page was stripped under
+        Returns:
+            Hex string of the concatenated digests
+        """
+        with self._lock:
+            return b"".join(sorted(self._page_blocks.get(key, ()))).hex()
+
+    def boilerplate_state(self):
+        """
+        Purpose:
+            Block digests of every page stripped under a key, to be saved
+            with the index so later runs keep counting where this one stopped
+        Args:
+            N/A
+        Returns:
+            Dict of page key -> hex string of the concatenated digests
+        """
+        with self._lock:
+            return {key: b"".join(sorted(blocks)).hex() for key, blocks in self._page_blocks.items()}
+
+    def load_boilerplate_state(self, state) -> None:
+        """
+        Purpose:
+            Count the blocks of pages an earlier run indexed, so boilerplate
+            they share is stripped from the pages that follow
+        Args:
+            state: dict returned by boilerplate_state
+        Returns:
+            N/A
+        """
+        with self._lock:
+            for key, digests in state.items():
+                self._forget(key)
+                raw = bytes.fromhex(digests)
+                blocks = {raw[i : i + _DIGEST_SIZE] for i in range(0, len(raw), _DIGEST_SIZE)}
+                self._page_blocks[key] = blocks
+                for block in blocks:
+                    self._block_pages[block] = self._block_pages.get(block, 0) + 1
+
+    def _check(self, text):
+        normalized = normalize_text(text)
+        key = _digest(normalized)
+        if key in self._hashes:
+            return "exact"
+        words = _WORD.findall(normalized)
+        signature = None
+        if len(words) >= MIN_NEAR_DUP_WORDS:
+            signature = minhash(words, self._permutations)
+            bands = [signature[i * self.rows : (i + 1) * self.rows].tobytes() for i in range(self.bands)]
+            candidates = set()
+            for band, bucket in zip(bands, self._buckets):
+                candidates.update(bucket.get(band, ()))
+            for other in candidates:
+                if np.mean(self._signatures[other] == signature) >= self.threshold:
+                    return "near"
+        self._hashes.add(key)
+        if signature is not None:
+            self._signatures.append(signature)
+            for band, bucket in zip(bands, self._buckets):
+                bucket.setdefault(band, []).append(len(self._signatures) - 1)
+        return None
+
+    def add(self, doc) -> None:
+        """
+        Purpose:
+            Record a chunk that is already indexed, e.g. after a resume
+        Args:
+            doc: chunk Document
+        Returns:
+            N/A
+        """
+        with self._lock:
+            self._check(doc.page_content)
+
+    def filter(self, chunks):
+        """
+        Purpose:
+            Drop chunks that duplicate a chunk seen before
+        Args:
+            chunks: chunk Documents
+        Returns:
+            List of the chunks to embed
+        """
+        kept = []
+        with self._lock:
+            for doc in chunks:
+                self.chunks += 1
+                duplicate = self._check(doc.page_content)
+                if duplicate == "exact":
+                    self.exact_duplicates += 1
+                elif duplicate == "near":
+                    self.near_duplicates += 1
+                else:
+                    kept.append(doc)
+        return kept
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pages": self.pages,
+                "blocks_stripped": self.blocks_stripped,
+                "chunks": self.chunks,
+                "exact_duplicates": self.exact_duplicates,
+                "near_duplicates": self.near_duplicates,
+                "embedding_calls_saved": self.exact_duplicates + self.near_duplicates,
+            }
+
+    def report(self) -> None:
+        stats = self.stats()
+        print(
+            f"Dedup: stripped {stats['blocks_stripped']} boilerplate blocks from {stats['pages']} pages, "
+            f"dropped {stats['exact_duplicates']} exact and {stats['near_duplicates']} near-duplicate "
+            f"chunks of {stats['chunks']}, saving {stats['embedding_calls_saved']} embedding calls"
+        )
@@ -0,0 +1,225 @@
+import os
+import threading
+
+import numpy as np
+
+from chunk_dedup import normalize_text
+
+# Prompt tokens spent on retrieved passages; Titan Text has an 8k token
+# window shared with the generated answer
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 3000))
+# Candidates fetched per passage kept, for MMR and the re-ranker to choose from
+CANDIDATE_FACTOR = 4
+# MMR trade-off: 1 ranks by relevance only, 0 by diversity only; 0.5 is the
+# LangChain default
+MMR_LAMBDA = 0.5
+# Hugging Face tokenizer used to measure the budget. Titan's tokenizer is
+# not published, a BPE tokenizer of similar vocabulary size is close
+CONTEXT_TOKENIZER = os.environ.get("CONTEXT_TOKENIZER", "gpt2")
+# Optional local cross-encoder, e.g. cross-encoder/ms-marco-MiniLM-L-6-v2;
+# needs torch. Unset to skip re-ranking
+CROSS_ENCODER_MODEL = os.environ.get("CROSS_ENCODER_MODEL") or None
+PASSAGE_SEPARATOR = "\n\n"
+
+
+class TokenCounter:
+    """
+    Counts and truncates text in tokens of a Hugging Face tokenizer, loaded
+    on first use. Falls back to about four characters per token if the
+    tokenizer cannot be loaded.
+    """
+
+    def __init__(self, name=CONTEXT_TOKENIZER):
+        self.name = name
+        self._tokenizer = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if not self._loaded:
+                try:
+                    from transformers import AutoTokenizer
+
+                    self._tokenizer = AutoTokenizer.from_pretrained(self.name)
+                except Exception as e:
+                    print(f"Could not load tokenizer {self.name}, estimating 4 characters per token: {e}")
+                self._loaded = True
+        return self._tokenizer
+
+    def _encode(self, text):
+        return self._load().encode(text, add_special_tokens=False)
+
+    def count(self, text):
+        if self._load() is None:
+            return (len(text) + 3) // 4
+        return len(self._encode(text))
+
+    def truncate(self, text, max_tokens):
+        if self._load() is None:
+            return text[: max_tokens * 4]
+        return self._tokenizer.decode(self._encode(text)[:max_tokens])
+
+
+class CrossEncoderReranker:
+    """
+    Scores (query, passage) pairs with a local sequence-classification
+    model, e.g. an MS MARCO cross-encoder.
+    """
+
+    def __init__(self, model_name, batch_size=16):
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        self.torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+        self.batch_size = batch_size
+
+    def scores(self, query, texts):
+        scores = []
+        with self.torch.no_grad():
+            for start in range(0, len(texts), self.batch_size):
+                batch = texts[start : start + self.batch_size]
+                inputs = self.tokenizer(
+                    [query] * len(batch), batch, padding=True, truncation=True, return_tensors="pt"
+                )
+                logits = self.model(**inputs).logits
+                scores.extend(logits[:, -1].tolist())
+        return np.array(scores, dtype=np.float32)
+
+
+# Shared by every tool in the process
+token_counter = TokenCounter()
+_cross_encoders = {}
+_cross_encoder_lock = threading.Lock()
+
+
+def get_cross_encoder(model_name):
+    """
+    Purpose:
+        Return the shared re-ranker for a model, loading it on first use
+    Args:
+        model_name: Hugging Face model id, or None
+    Returns:
+        CrossEncoderReranker, or None if model_name is None or the model
+        cannot be loaded
+    """
+    if not model_name:
+        return None
+    with _cross_encoder_lock:
+        if model_name not in _cross_encoders:
+            try:
+                _cross_encoders[model_name] = CrossEncoderReranker(model_name)
+            except Exception as e:
+                print(f"Could not load cross-encoder {model_name}, skipping re-ranking: {e}")
+                _cross_encoders[model_name] = None
+        return _cross_encoders[model_name]
+
+
+def _unit_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def mmr_order(query_vector, vectors, relevance=None, lambda_mult=MMR_LAMBDA):
+    """
+    Purpose:
+        Order candidates by maximal marginal relevance, so each pick is
+        relevant to the query but unlike the passages already picked
+    Args:
+        query_vector: embedding of the query
+        vectors: float32 array of candidate embeddings
+        relevance: relevance of each candidate, cosine similarity to the
+            query if None
+        lambda_mult: relevance weight, see MMR_LAMBDA
+    Returns:
+        List of candidate positions, in pick order
+    """
+    vectors = _unit_rows(np.asarray(vectors, dtype=np.float32))
+    if relevance is None:
+        relevance = vectors @ _unit_rows(np.asarray(query_vector, dtype=np.float32))
+    similarity = vectors @ vectors.T
+    redundancy = np.zeros(len(vectors), dtype=np.float32)
+    remaining = np.ones(len(vectors), dtype=bool)
+    order = []
+    for _ in range(len(vectors)):
+        scores = np.where(remaining, lambda_mult * relevance - (1 - lambda_mult) * redundancy, -np.inf)
+        pick = int(np.argmax(scores))
+        order.append(pick)
+        remaining[pick] = False
+        redundancy = np.maximum(redundancy, similarity[pick])
+    return order
+
+
+def build_context(
+    query,
+    query_vector,
+    docs,
+    vectors,
+    max_passages=4,
+    token_budget=CONTEXT_TOKEN_BUDGET,
+    lambda_mult=MMR_LAMBDA,
+    reranker=None,
+    counter=token_counter,
+):
+    """
+    Purpose:
+        Pick and pack retrieved passages into the prompt context: duplicate
+        chunks are dropped, the rest are optionally re-ranked with a
+        cross-encoder, diversified with MMR and added in that order while
+        they fit the token budget
+    Args:
+        query: question text
+        query_vector: embedding of the query
+        docs: candidate Documents, best first
+        vectors: float32 array of their embeddings
+        max_passages: passages kept at most
+        token_budget: tokens the context may use, separators included
+        lambda_mult: MMR relevance weight
+        reranker: CrossEncoderReranker, or None
+        counter: TokenCounter measuring the budget
+    Returns:
+        Tuple of (context string, list of the Documents used, in order)
+    """
+    candidates = len(docs)
+    seen = set()
+    keep = []
+    for i, doc in enumerate(docs):
+        key = normalize_text(doc.page_content)
+        if key and key not in seen:
+            seen.add(key)
+            keep.append(i)
+    if not keep:
+        return "", []
+    docs = [docs[i] for i in keep]
+    vectors = np.asarray(vectors, dtype=np.float32)[keep]
+
+    relevance = None
+    if reranker is not None:
+        scores = reranker.scores(query, [doc.page_content for doc in docs])
+        spread = scores.max() - scores.min()
+        relevance = (scores - scores.min()) / spread if spread else np.ones_like(scores)
+
+    separator_tokens = counter.count(PASSAGE_SEPARATOR)
+    passages, used, tokens = [], [], 0
+    for i in mmr_order(query_vector, vectors, relevance, lambda_mult):
+        if len(passages) == max_passages:
+            break
+        text = docs[i].page_content
+        cost = counter.count(text) + (separator_tokens if passages else 0)
+        if tokens + cost > token_budget:
+            if passages:
+                continue
+            # The best passage alone is over budget: keep its start
+            text = counter.truncate(text, token_budget)
+            cost = counter.count(text)
+        passages.append(text)
+        used.append(docs[i])
+        tokens += cost
+
+    print(
+        f"Context: {len(passages)} passages, {tokens} of {token_budget} tokens, "
+        f"{candidates - len(keep)} duplicates dropped from {candidates} candidates"
+    )
+    return PASSAGE_SEPARATOR.join(passages), used
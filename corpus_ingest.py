@@ -0,0 +1,263 @@
+import argparse
+import os
+from langchain.document_loaders import SeleniumURLLoader
+from langchain.embeddings import OpenAIEmbeddings
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.vectorstores import FAISS
+
+from ann_index import INDEX_TYPES, save_vectorstore
+from bedrock_client import INGEST_MAX_ATTEMPTS, bedrock_embeddings
+from chunk_dedup import ChunkDeduplicator
+from embedding_pipeline import DEAD_LETTER_FILE, embed_documents_to_index, retry_dead_letters, write_dead_letters
+from incremental_index import (
+    build_manifest,
+    load_manifest,
+    update_index_incrementally,
+    write_manifest,
+)
+from ingest_checkpoint import IngestCheckpoint
+from ingest_pipeline import run_ingest_pipeline
+from page_fetcher import PageFetcher
+from pdf_loader import iter_pdf_pages, load_pdfs
+from sitemap import crawl_sitemaps
+
+# Setup Chrome Driver, may need to change based on system.
+# Browsers are only started for pages that need JavaScript to render
+fetcher = PageFetcher(chromedriver_path="/Users/vtbloise/Downloads/chromedriver_mac64/chromedriver")
+
+def extract_url_lastmods_from_sitemap(sitemap_url, include=None, exclude=None):
+    # Follows sitemap indexes and gzipped child sitemaps; also takes a local path
+    lastmods, _ = crawl_sitemaps([sitemap_url], include, exclude)
+    return lastmods
+
+def extract_urls_from_sitemap(sitemap_url):
+    return list(extract_url_lastmods_from_sitemap(sitemap_url))
+
+def load_pdf_text(pdfs):
+    # URLs, files, directories or globs; pages are extracted in parallel and
+    # chunked with the same splitter as HTML
+    if isinstance(pdfs, str):
+        pdfs = [pdfs]
+    return split_text(load_pdfs(pdfs))
+
+def load_html_pages(sitemap_urls):
+    return fetcher.fetch(sitemap_urls)
+
+def split_text(data):
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=20)
+    texts = text_splitter.split_documents(data)
+
+    return texts
+
+def load_html_text(sitemap_urls):
+    return split_text(load_html_pages(sitemap_urls))
+
+def load_html_text_tester(sitemap_urls):
+    loader = SeleniumURLLoader(urls=sitemap_urls)
+    data = loader.load()
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=20)
+    texts = text_splitter.split_documents(data)
+
+    return texts
+
+
+def embed_text_OpenAI(texts, save_loc):
+    embeddings = OpenAIEmbeddings(openai_api_key=os.environ["OPENAI_API_KEY"])
+    docsearch = FAISS.from_documents(texts, embeddings)
+
+    save_vectorstore(docsearch, save_loc)
+
+def embed_text_Bedrock(texts, save_loc):
+    embeddings = bedrock_embeddings()
+    docsearch = FAISS.from_documents(texts, embeddings)
+
+    save_vectorstore(docsearch, save_loc)
+
+def embed_text_Bedrock_with_timeout_avoid_logic(texts, save_loc):
+    embeddings = bedrock_embeddings(max_attempts=INGEST_MAX_ATTEMPTS)
+
+    # Embed concurrently under a rate limit, then build the index once.
+    # Chunks that fail every retry go to a dead-letter file for --retry-failed
+    final_db, failed = embed_documents_to_index(
+        texts, embeddings, dead_letter_path=os.path.join(save_loc, DEAD_LETTER_FILE)
+    )
+    if failed:
+        print(f"Failed to embed {len(failed)} of {len(texts)} chunks, rerun with --retry-failed")
+
+    save_vectorstore(final_db, save_loc)
+    return failed
+
+
+def ingest_text_Bedrock_streaming(urls, save_loc, checkpoint, dedup, documents=(), index_type="flat"):
+    embeddings = bedrock_embeddings(max_attempts=INGEST_MAX_ATTEMPTS)
+
+    # Fetching, splitting, embedding and indexing run concurrently as
+    # bounded stages. Boilerplate and duplicate chunks are dropped before
+    # embedding. Chunks that fail every retry go to a dead-letter file for
+    # --retry-failed
+    final_db, failed, indexed = run_ingest_pipeline(
+        urls, fetcher.fetch_one, split_text, embeddings, checkpoint, documents, dedup
+    )
+    write_dead_letters(os.path.join(save_loc, DEAD_LETTER_FILE), failed)
+    if failed:
+        print(f"Failed to embed {len(failed)} chunks, rerun with --retry-failed")
+
+    # The pipeline builds a flat index, approximate types are trained here
+    save_vectorstore(final_db, save_loc, index_type)
+    return final_db, failed, indexed
+
+def embed_failed_chunks_Bedrock(save_loc):
+    embeddings = bedrock_embeddings(max_attempts=INGEST_MAX_ATTEMPTS)
+
+    retry_dead_letters(save_loc, embeddings)
+
+def update_text_Bedrock_incremental(lastmods, save_loc, failed_sitemaps=()):
+    embeddings = bedrock_embeddings(max_attempts=INGEST_MAX_ATTEMPTS)
+
+    # Pages of sitemaps that could not be read are kept, not removed
+    update_index_incrementally(
+        save_loc,
+        lastmods,
+        load_html_pages,
+        split_text,
+        embeddings,
+        ChunkDeduplicator(),
+        failed_sitemaps=failed_sitemaps,
+    )
+
+
+def ingest_corpus(
+    save_loc,
+    sitemaps,
+    pdfs=(),
+    retry_failed=False,
+    restart=False,
+    incremental=False,
+    include=None,
+    exclude=None,
+    index_type="flat",
+) -> None:
+    """
+    Purpose:
+        Ingest the pages of a corpus's sitemaps, and its PDFs, into a local db
+    Args:
+        save_loc: local_index_* directory of the corpus
+        sitemaps: sitemap URLs or local paths listing the corpus's pages
+        pdfs: PDF URLs, files, directories or globs to ingest with the pages
+        retry_failed: only embed the chunks a previous run failed on and
+            append them to the existing index
+        restart: discard the checkpoint of an interrupted run
+        incremental: only fetch and embed what changed since the index
+            was built, using the manifest saved with it
+        include: regular expressions a page URL must match to be ingested
+        exclude: regular expressions that keep a page URL out of the index
+        index_type: FAISS index type of a full build, one of INDEX_TYPES
+    Returns:
+        N/A
+    """
+    if retry_failed:
+        embed_failed_chunks_Bedrock(save_loc)
+        return
+
+    # Get all links, and their lastmod, from the sitemaps
+    lastmods, failed_sitemaps = crawl_sitemaps(sitemaps, include, exclude)
+    full_sitemap_list = list(lastmods)
+
+    if incremental:
+        if load_manifest(save_loc) is not None:
+            update_text_Bedrock_incremental(lastmods, save_loc, failed_sitemaps)
+            fetcher.close()
+            return
+        print(f"No manifest in {save_loc}, building the full index")
+
+    # Indexed chunks and finished pages are checkpointed here so an
+    # interrupted run resumes where it stopped
+    checkpoint = IngestCheckpoint(save_loc + "_work")
+    if restart:
+        checkpoint.clear()
+        checkpoint = IngestCheckpoint(save_loc + "_work")
+
+    print(full_sitemap_list)
+    # get the raw html text and the PDFs and save embeddings to local_index
+    dedup = ChunkDeduplicator()
+    final_db, failed, indexed = ingest_text_Bedrock_streaming(
+        full_sitemap_list,
+        save_loc,
+        checkpoint,
+        dedup,
+        documents=iter_pdf_pages(list(pdfs)),
+        index_type=index_type,
+    )
+    # Recorded so the next --incremental run only processes what changed,
+    # refetches pages that could not be fetched this time and keeps
+    # stripping the boilerplate counted here
+    write_manifest(save_loc, build_manifest(lastmods, failed, indexed, dedup.boilerplate_state()))
+    checkpoint.clear()
+    fetcher.close()
+
+
+def main(save_loc, sitemaps, pdfs=()) -> None:
+    """
+    Purpose:
+        Command line of an ingest script: parse its options and ingest the
+        corpus it declares
+    Args:
+        save_loc: local_index_* directory of the corpus
+        sitemaps: sitemap URLs or local paths listing the corpus's pages
+        pdfs: PDFs always ingested with the corpus; --pdf adds more
+    Returns:
+        N/A
+    """
+    parser = argparse.ArgumentParser(description=f"Ingest pages and PDFs into {save_loc}")
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="embed only the chunks in the dead-letter file and append them to the existing index",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="ignore the checkpoint of an interrupted run and start over",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="refresh the existing index with new, changed and removed pages only",
+    )
+    parser.add_argument(
+        "--include",
+        action="append",
+        metavar="REGEX",
+        help="only ingest page URLs matching this pattern (repeatable)",
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        metavar="REGEX",
+        help="skip page URLs matching this pattern (repeatable)",
+    )
+    parser.add_argument(
+        "--pdf",
+        action="append",
+        metavar="SOURCE",
+        help="PDF URL, file, directory or glob to ingest with the pages (repeatable)",
+    )
+    parser.add_argument(
+        "--index-type",
+        choices=INDEX_TYPES,
+        default="flat",
+        help="flat (exact), an approximate index or compressed vectors; compare them with python ann_index.py",
+    )
+    args = parser.parse_args()
+    ingest_corpus(
+        save_loc,
+        sitemaps,
+        list(pdfs) + (args.pdf or []),
+        retry_failed=args.retry_failed,
+        restart=args.restart,
+        incremental=args.incremental,
+        include=args.include,
+        exclude=args.exclude,
+        index_type=args.index_type,
+    )
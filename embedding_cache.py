@@ -0,0 +1,111 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+
+from langchain.embeddings.base import Embeddings
+
+# Number of query vectors kept in memory, override with EMBEDDING_CACHE_SIZE
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", 4096))
+# Optional SQLite file that keeps query vectors across restarts
+EMBEDDING_CACHE_DB = os.environ.get("EMBEDDING_CACHE_DB")
+
+
+def normalize_query(text):
+    """
+    Purpose:
+        Normalize a query so trivially different spellings share a cache entry
+    Args:
+        text: query text
+    Returns:
+        Case-folded text with whitespace collapsed
+    """
+    return " ".join(text.split()).casefold()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings client and caches query vectors keyed by model id
+    and normalized query text. Lookups go to an in-memory LRU first, then
+    to the optional SQLite file, and only then to the wrapped client.
+    Document embeddings are passed straight through.
+    """
+
+    def __init__(self, embeddings, model_id=None, max_entries=EMBEDDING_CACHE_SIZE, db_path=EMBEDDING_CACHE_DB):
+        self.embeddings = embeddings
+        self.model_id = model_id or getattr(embeddings, "model_id", type(embeddings).__name__)
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "model_id TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model_id, text_hash))"
+            )
+            self._db.commit()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _key(self, text):
+        return hashlib.sha256(normalize_query(text).encode("utf-8")).hexdigest()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def embed_query(self, text):
+        key = self._key(text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return list(vector)
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT vector FROM query_embeddings WHERE model_id = ? AND text_hash = ?",
+                    (self.model_id, key),
+                ).fetchone()
+                if row is not None:
+                    vector = array("f")
+                    vector.frombytes(row[0])
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return list(vector)
+            self.misses += 1
+
+        # Remote call happens outside the lock
+        result = self.embeddings.embed_query(text)
+        vector = array("f", result)
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (model_id, text_hash, vector) VALUES (?, ?, ?)",
+                    (self.model_id, key, vector.tobytes()),
+                )
+                self._db.commit()
+        return result
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
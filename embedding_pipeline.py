@@ -0,0 +1,341 @@
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain.docstore.in_memory import InMemoryDocstore
+from langchain.vectorstores import FAISS
+from langchain.vectorstores.faiss import dependable_faiss_import
+
+from ann_index import full_vectors, index_type_of, save_vectorstore
+from vector_store import indexed_documents, load_store, store_dir
+
+# Defaults for the ingest scripts, tune to the account's Bedrock quotas
+EMBED_MAX_WORKERS = 8
+EMBED_REQUESTS_PER_SECOND = 10.0
+EMBED_MAX_RETRIES = 6
+# Backoff before retry n is uniform in [0, min(cap, base * 2 ** n)] seconds
+EMBED_BACKOFF_BASE = 0.5
+EMBED_BACKOFF_CAP = 30.0
+# Chunks that still fail after every retry are written here, inside the index directory
+DEAD_LETTER_FILE = "failed_chunks.jsonl"
+
+
+class TokenBucket:
+    """
+    Limits the request rate to rate requests per second with bursts of up to
+    capacity requests.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveLimiter:
+    """
+    Caps the number of requests in flight. The cap is halved whenever the
+    service throttles and grows back by one after every `increase_after`
+    successful requests, up to max_concurrency.
+    """
+
+    def __init__(self, max_concurrency, increase_after=20):
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self.increase_after = increase_after
+        self._in_flight = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self._in_flight >= self.limit:
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self, throttled=False) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            if throttled:
+                self.limit = max(1, self.limit // 2)
+                self._successes = 0
+                print(f"Throttled, concurrency lowered to {self.limit}")
+            else:
+                self._successes += 1
+                if self._successes >= self.increase_after and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+
+def is_throttling_error(error):
+    """
+    Purpose:
+        Tell Bedrock throttling apart from other failures
+    Args:
+        error: exception raised by the embeddings client
+    Returns:
+        True if the request was throttled
+    """
+    message = str(error)
+    return any(marker in message for marker in ("Throttling", "TooManyRequests", "Rate exceeded"))
+
+
+def backoff_delay(attempt, base=EMBED_BACKOFF_BASE, cap=EMBED_BACKOFF_CAP):
+    """
+    Purpose:
+        Exponential backoff with full jitter
+    Args:
+        attempt: number of failed attempts so far, starting at 0
+        base: delay scale in seconds
+        cap: maximum delay in seconds
+    Returns:
+        Seconds to sleep before the next attempt
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def embed_with_retry(text, embeddings, limiter, bucket, max_retries=EMBED_MAX_RETRIES, query=False):
+    """
+    Purpose:
+        Embed one text under the shared limits, retrying with backoff
+    Args:
+        text: string to embed
+        embeddings: Embeddings client
+        limiter: AdaptiveLimiter shared by all workers
+        bucket: TokenBucket shared by all workers
+        max_retries: retries before giving up
+        query: embed with embed_query, which goes through the query cache
+    Returns:
+        Embedding vector; the last error is raised once retries run out
+    """
+    attempt = 0
+    while True:
+        limiter.acquire()
+        bucket.acquire()
+        try:
+            vector = embeddings.embed_query(text) if query else embeddings.embed_documents([text])[0]
+        except Exception as e:
+            limiter.release(throttled=is_throttling_error(e))
+            if attempt < max_retries:
+                time.sleep(backoff_delay(attempt))
+                attempt += 1
+                continue
+            raise
+        limiter.release()
+        return vector
+
+
+def embed_texts_concurrently(
+    texts,
+    embeddings,
+    max_workers=EMBED_MAX_WORKERS,
+    requests_per_second=EMBED_REQUESTS_PER_SECOND,
+    max_retries=EMBED_MAX_RETRIES,
+    query=False,
+):
+    """
+    Purpose:
+        Embed texts through a bounded thread pool with rate limiting,
+        adaptive concurrency and per-request retries
+    Args:
+        texts: list of strings
+        embeddings: Embeddings client, one request per text
+        max_workers: upper bound on requests in flight
+        requests_per_second: token bucket rate
+        max_retries: retries per text before it is reported as failed
+        query: embed texts as queries (see embed_with_retry)
+    Returns:
+        Tuple of (float32 array with one row per text, list of indexes of
+        texts that could not be embedded; their rows are zero)
+    """
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32), []
+
+    bucket = TokenBucket(requests_per_second)
+    limiter = AdaptiveLimiter(max_workers)
+    state = {"vectors": None}
+    state_lock = threading.Lock()
+    failed = []
+    completed = [0]
+
+    def embed_one(i):
+        try:
+            vector = embed_with_retry(texts[i], embeddings, limiter, bucket, max_retries, query)
+        except Exception as e:
+            print(f"Failed to embed {'query' if query else 'chunk'} {i} after {max_retries + 1} attempts: {e}")
+            with state_lock:
+                failed.append(i)
+            return
+        with state_lock:
+            if state["vectors"] is None:
+                state["vectors"] = np.zeros((len(texts), len(vector)), dtype=np.float32)
+            state["vectors"][i] = vector
+            completed[0] += 1
+            if completed[0] % 100 == 0:
+                print(f"Embedded {completed[0]} of {len(texts)} {'queries' if query else 'chunks'}")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for future in [executor.submit(embed_one, i) for i in range(len(texts))]:
+            future.result()
+
+    if state["vectors"] is None:
+        return np.empty((len(texts), 0), dtype=np.float32), sorted(failed)
+    return state["vectors"], sorted(failed)
+
+
+def build_faiss_index(documents, vectors, embeddings):
+    """
+    Purpose:
+        Build a FAISS vector store in one pass from precomputed vectors
+    Args:
+        documents: list of Documents, one per row of vectors
+        vectors: float32 array of embeddings
+        embeddings: Embeddings used for queries against the index
+    Returns:
+        FAISS vector store
+    """
+    faiss = dependable_faiss_import()
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    ids = [str(uuid.uuid4()) for _ in documents]
+    docstore = InMemoryDocstore(dict(zip(ids, documents)))
+    return FAISS(embeddings.embed_query, index, docstore, dict(enumerate(ids)))
+
+
+def write_dead_letters(path, documents) -> None:
+    """
+    Purpose:
+        Persist chunks that could not be embedded so they can be retried
+    Args:
+        path: JSON lines file, replaced on every call
+        documents: list of failed Documents
+    Returns:
+        N/A
+    """
+    if not documents:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        for doc in documents:
+            f.write(json.dumps({"page_content": doc.page_content, "metadata": doc.metadata}) + "\n")
+    print(f"Wrote {len(documents)} failed chunks to {path}")
+
+
+def read_dead_letters(path):
+    """
+    Purpose:
+        Load chunks written by write_dead_letters
+    Args:
+        path: JSON lines file
+    Returns:
+        List of Documents, empty if the file does not exist
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [Document(**json.loads(line)) for line in f if line.strip()]
+
+
+def embed_documents_to_index(
+    documents,
+    embeddings,
+    max_workers=EMBED_MAX_WORKERS,
+    requests_per_second=EMBED_REQUESTS_PER_SECOND,
+    dead_letter_path=None,
+):
+    """
+    Purpose:
+        Embed chunked Documents concurrently and index them
+    Args:
+        documents: list of Documents from the text splitter
+        embeddings: Embeddings client
+        max_workers: upper bound on requests in flight
+        requests_per_second: token bucket rate
+        dead_letter_path: optional file for chunks that failed every retry
+    Returns:
+        Tuple of (FAISS vector store, list of Documents that failed)
+    """
+    vectors, failed = embed_texts_concurrently(
+        [doc.page_content for doc in documents], embeddings, max_workers, requests_per_second
+    )
+    failed_docs = [documents[i] for i in failed]
+    if dead_letter_path:
+        write_dead_letters(dead_letter_path, failed_docs)
+    failed_set = set(failed)
+    keep = [i for i in range(len(documents)) if i not in failed_set]
+    if not keep:
+        raise ValueError("No chunks could be embedded")
+    db = build_faiss_index([documents[i] for i in keep], vectors[keep], embeddings)
+    return db, failed_docs
+
+
+def retry_dead_letters(
+    save_loc,
+    embeddings,
+    max_workers=EMBED_MAX_WORKERS,
+    requests_per_second=EMBED_REQUESTS_PER_SECOND,
+):
+    """
+    Purpose:
+        Embed the chunks a previous run could not and append them to the
+        existing index in save_loc
+    Args:
+        save_loc: local_index_* directory holding the index and dead letters
+        embeddings: Embeddings client
+        max_workers: upper bound on requests in flight
+        requests_per_second: token bucket rate
+    Returns:
+        List of Documents that failed again
+    """
+    dead_letter_path = os.path.join(save_loc, DEAD_LETTER_FILE)
+    documents = read_dead_letters(dead_letter_path)
+    if not documents:
+        print(f"No failed chunks in {dead_letter_path}")
+        return []
+
+    print(f"Retrying {len(documents)} failed chunks")
+    vectors, failed = embed_texts_concurrently(
+        [doc.page_content for doc in documents], embeddings, max_workers, requests_per_second
+    )
+    failed_set = set(failed)
+    keep = [i for i in range(len(documents)) if i not in failed_set]
+    if keep:
+        index_type = "flat"
+        new_documents = [documents[i] for i in keep]
+        new_vectors = vectors[keep]
+        if os.path.exists(os.path.join(store_dir(save_loc), "index.faiss")):
+            # Rebuilt rather than appended to, the saved docstore is read-only
+            db = load_store(save_loc, embeddings, mmap=False)
+            index_type = index_type_of(db.index)
+            new_documents = indexed_documents(db) + new_documents
+            new_vectors = np.concatenate([full_vectors(db, save_loc), new_vectors])
+        db = build_faiss_index(new_documents, new_vectors, embeddings)
+        save_vectorstore(db, save_loc, index_type, new_vectors)
+        print(f"Appended {len(keep)} chunks to {save_loc}")
+
+    failed_docs = [documents[i] for i in failed]
+    write_dead_letters(dead_letter_path, failed_docs)
+    return failed_docs
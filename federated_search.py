@@ -0,0 +1,93 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain.docstore.document import Document
+
+from bedrock_tools import get_embeddings, load_tool_registry
+
+# Corpora searched at once; FAISS releases the GIL while it searches
+FEDERATED_WORKERS = int(os.environ.get("FEDERATED_WORKERS", 8))
+
+_executor = ThreadPoolExecutor(max_workers=FEDERATED_WORKERS)
+
+
+def normalized_score(distance, query_norm_sq):
+    """
+    Purpose:
+        Turn a squared L2 distance into a score in (0, 1], higher is closer.
+        Dividing by the squared norm of the query makes scores independent
+        of the embedding scale, so hits from every corpus (all embedded with
+        the same model) rank on one scale
+    Args:
+        distance: squared L2 distance between the query and a chunk
+        query_norm_sq: squared norm of the query vector
+    Returns:
+        Float score
+    """
+    return 1.0 / (1.0 + max(distance, 0.0) / (query_norm_sq or 1.0))
+
+
+def federated_search_by_vector(query_vector, labels=None, k=4, tools=None):
+    """
+    Purpose:
+        Search several corpora for one query vector, each corpus in its own
+        thread, and merge the hits by normalized score
+    Args:
+        query_vector: embedding of the query
+        labels: tool labels of the corpora to search, all of them if None
+        k: chunks to return in total
+        tools: dict of label -> RagTool, the tool registry if None
+    Returns:
+        List of up to k Documents, best first; metadata of each has the
+        corpus label it came from and its score
+    """
+    tools = tools if tools is not None else load_tool_registry()
+    labels = list(tools) if labels is None else labels
+    query_norm_sq = float(np.dot(query_vector, query_vector))
+
+    # Each corpus contributes at most k hits, the merge keeps the best k
+    futures = {label: _executor.submit(tools[label].retrieve_with_scores, query_vector, k) for label in labels}
+    hits = []
+    for label, future in futures.items():
+        try:
+            scored = future.result()
+        except Exception as e:
+            print(f"Federated search skipped {label}: {e}")
+            continue
+        for doc, distance in scored:
+            score = normalized_score(distance, query_norm_sq)
+            metadata = {**doc.metadata, "corpus": label, "score": score}
+            hits.append(Document(page_content=doc.page_content, metadata=metadata))
+    hits.sort(key=lambda doc: doc.metadata["score"], reverse=True)
+    return hits[:k]
+
+
+def federated_search(query, labels=None, k=4, tools=None):
+    """
+    Purpose:
+        Search several corpora for one query, embedding it only once
+    Args:
+        query: question text
+        labels: tool labels of the corpora to search, all of them if None
+        k: chunks to return in total
+        tools: dict of label -> RagTool, the tool registry if None
+    Returns:
+        List of up to k Documents, see federated_search_by_vector
+    """
+    return federated_search_by_vector(get_embeddings().embed_query(query), labels, k, tools)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search several corpora with one query")
+    parser.add_argument("query")
+    parser.add_argument("--corpus", action="append", metavar="LABEL", help="tool label, repeatable; default all")
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    docs = federated_search(args.query, args.corpus, args.k)
+    print(f"{len(docs)} hits in {(time.perf_counter() - start) * 1000:.0f} ms")
+    for doc in docs:
+        print(f"{doc.metadata['score']:.3f}  {doc.metadata['corpus']}  {doc.metadata['source']}")
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from ann_index import full_vectors, index_type_of, save_vectorstore
+from embedding_pipeline import (
+    DEAD_LETTER_FILE,
+    EMBED_MAX_WORKERS,
+    EMBED_REQUESTS_PER_SECOND,
+    build_faiss_index,
+    embed_texts_concurrently,
+    write_dead_letters,
+)
+from vector_store import indexed_documents, load_store
+
+# Written in the local_index_* directory, next to the index generations
+MANIFEST_FILE = "manifest.json"
+
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_manifest(save_loc):
+    """
+    Purpose:
+        Read the per-URL lastmod recorded for an index
+    Args:
+        save_loc: local_index_* directory
+    Returns:
+        Manifest dict, or None if the index has no manifest
+    """
+    path = os.path.join(save_loc, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(save_loc, manifest) -> None:
+    os.makedirs(save_loc, exist_ok=True)
+    path = os.path.join(save_loc, MANIFEST_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def build_manifest(lastmods, failed=(), indexed=None, boilerplate=None):
+    """
+    Purpose:
+        Describe a freshly built index so the next run can be incremental.
+        Unchanged chunks are recognized by hashing the chunks in the index
+        itself, so only the lastmod of each page is recorded
+    Args:
+        lastmods: dict of sitemap URL -> <lastmod> text or None
+        failed: Documents that could not be embedded; their pages are
+            marked for refetching
+        indexed: URLs of the pages that were fetched and indexed, None if
+            all of them were; the others are marked for refetching too
+        boilerplate: ChunkDeduplicator.boilerplate_state of the build, so
+            incremental runs keep stripping the boilerplate it counted
+    Returns:
+        Manifest dict
+    """
+    pages = {
+        url: {"lastmod": lastmod if indexed is None or url in indexed else None}
+        for url, lastmod in lastmods.items()
+    }
+    for doc in failed:
+        page = pages.get(doc.metadata.get("source"))
+        if page is not None:
+            page["lastmod"] = None
+    return {"pages": pages, "boilerplate": boilerplate or {}}
+
+
+def plan_update(lastmods, manifest, failed_sitemaps=()):
+    """
+    Purpose:
+        Work out which sitemap pages changed since the manifest was written
+    Args:
+        lastmods: dict of sitemap URL -> <lastmod> text or None
+        manifest: manifest of the current index
+        failed_sitemaps: sitemaps the crawl could not read in full. Pages
+            missing from lastmods may then only be missing from the crawl,
+            so nothing is removed
+    Returns:
+        Tuple of (URLs to fetch, URLs no longer in the sitemap)
+    """
+    old = manifest["pages"]
+    to_fetch = [
+        url
+        for url, lastmod in lastmods.items()
+        # Pages without a lastmod are always refetched, chunk hashes then
+        # decide what actually needs embedding
+        if url not in old or lastmod is None or old[url]["lastmod"] != lastmod
+    ]
+    removed = [url for url in old if url not in lastmods]
+    if failed_sitemaps and removed:
+        print(f"Keeping {len(removed)} pages missing from the sitemaps, {len(failed_sitemaps)} could not be read")
+        removed = []
+    return to_fetch, removed
+
+
+def indexed_chunks(db, save_loc=None):
+    """
+    Purpose:
+        Read every chunk and its full-precision vector back out of an index
+    Args:
+        db: FAISS vector store
+        save_loc: directory the store was loaded from
+    Returns:
+        Tuple of (list of Documents, float32 array of vectors)
+    """
+    return indexed_documents(db), full_vectors(db, save_loc)
+
+
+def update_index_incrementally(
+    save_loc,
+    lastmods,
+    fetch_pages,
+    split_documents,
+    embeddings,
+    dedup=None,
+    max_workers=EMBED_MAX_WORKERS,
+    requests_per_second=EMBED_REQUESTS_PER_SECOND,
+    failed_sitemaps=(),
+):
+    """
+    Purpose:
+        Refresh an existing index: fetch only new or changed pages, drop
+        pages that left the sitemap and embed only chunks whose text hash
+        is not already in the index
+    Args:
+        save_loc: local_index_* directory with an index and a manifest
+        lastmods: dict of sitemap URL -> <lastmod> text or None
+        fetch_pages: function taking a list of URLs and returning Documents
+        split_documents: function splitting page Documents into chunks
+        embeddings: Embeddings client
+        dedup: optional ChunkDeduplicator; it is loaded with the
+            boilerplate counted by earlier runs, and changed chunks that
+            duplicate a chunk already in the index are dropped
+        max_workers: upper bound on embedding requests in flight
+        requests_per_second: embedding request rate
+        failed_sitemaps: sitemaps the crawl could not read in full; no
+            pages are removed when there are any
+    Returns:
+        N/A
+    """
+    manifest = load_manifest(save_loc)
+    to_fetch, removed = plan_update(lastmods, manifest, failed_sitemaps)
+    print(f"{len(to_fetch)} pages new or changed, {len(removed)} removed")
+    if not to_fetch and not removed:
+        print("Index is up to date")
+        return
+
+    db = load_store(save_loc, embeddings, mmap=False)
+    index_type = index_type_of(db.index)
+    old_documents, old_vectors = indexed_chunks(db, save_loc)
+    vector_by_hash = {
+        chunk_hash(doc.page_content): old_vectors[i] for i, doc in enumerate(old_documents)
+    }
+
+    pages = fetch_pages(to_fetch) if to_fetch else []
+    refreshed = {doc.metadata.get("source") for doc in pages}
+    dropped = refreshed | set(removed)
+
+    # Chunks of untouched pages, and of sources the manifest does not track
+    # (e.g. PDFs), are carried over with their existing vectors
+    documents = [doc for doc in old_documents if doc.metadata.get("source") not in dropped]
+    vectors = [old_vectors[i] for i, doc in enumerate(old_documents) if doc.metadata.get("source") not in dropped]
+
+    boilerplate = manifest.get("boilerplate", {})
+    if dedup is not None:
+        dedup.load_boilerplate_state(boilerplate)
+        for url in removed:
+            dedup.forget(url)
+        for doc in documents:
+            dedup.add(doc)
+        pages = [dedup.strip_boilerplate(page, page.metadata.get("source")) for page in pages]
+        boilerplate = dedup.boilerplate_state()
+    new_chunks = split_documents(pages)
+    if dedup is not None:
+        new_chunks = dedup.filter(new_chunks)
+        dedup.report()
+    to_embed = []
+    for doc in new_chunks:
+        vector = vector_by_hash.get(chunk_hash(doc.page_content))
+        if vector is None:
+            to_embed.append(doc)
+        else:
+            documents.append(doc)
+            vectors.append(vector)
+    reused = len(new_chunks) - len(to_embed)
+    print(f"{len(new_chunks)} chunks in changed pages, {reused} unchanged, {len(to_embed)} to embed")
+
+    new_vectors, failed = embed_texts_concurrently(
+        [doc.page_content for doc in to_embed], embeddings, max_workers, requests_per_second
+    )
+    failed_set = set(failed)
+    for i, doc in enumerate(to_embed):
+        if i not in failed_set:
+            documents.append(doc)
+            vectors.append(new_vectors[i])
+    failed_docs = [to_embed[i] for i in failed]
+    write_dead_letters(os.path.join(save_loc, DEAD_LETTER_FILE), failed_docs)
+
+    if not documents:
+        raise ValueError("No chunks left to index")
+    vectors = np.array(vectors, dtype=np.float32)
+    db = build_faiss_index(documents, vectors, embeddings)
+    # Keeps the index type the corpus was built with
+    save_vectorstore(db, save_loc, index_type, vectors)
+
+    # Manifests written before only lastmod was recorded also list chunk hashes
+    pages_manifest = {url: {"lastmod": page["lastmod"]} for url, page in manifest["pages"].items()}
+    for url in removed:
+        pages_manifest.pop(url, None)
+    refreshed_manifest = build_manifest({url: lastmods[url] for url in refreshed if url in lastmods}, failed_docs)
+    pages_manifest.update(refreshed_manifest["pages"])
+    write_manifest(save_loc, {"pages": pages_manifest, "boilerplate": boilerplate})
+    print(f"Index updated: {len(documents)} chunks, {len(to_embed) - len(failed)} embedded")
@@ -0,0 +1,196 @@
+import os
+import threading
+from collections import OrderedDict
+
+from vector_store import docstore_path, load_store, store_dir
+
+# Upper bound on the on-disk size of all resident indexes, override with
+# the INDEX_CACHE_MAX_BYTES environment variable
+INDEX_CACHE_MAX_BYTES = int(os.environ.get("INDEX_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+
+def index_files(folder_path, index_name="index"):
+    """
+    Purpose:
+        List the files of a saved index
+    Args:
+        folder_path: local_index_* directory
+        index_name: base name used when the index was saved
+    Returns:
+        List of file paths, in the current generation of the index
+    """
+    folder_path = store_dir(folder_path, index_name)
+    sqlite_path = docstore_path(folder_path, index_name)
+    if os.path.exists(sqlite_path):
+        return [os.path.join(folder_path, f"{index_name}.faiss"), sqlite_path]
+    return [
+        os.path.join(folder_path, f"{index_name}.faiss"),
+        os.path.join(folder_path, f"{index_name}.pkl"),
+    ]
+
+
+def index_signature(folder_path, index_name="index"):
+    """
+    Purpose:
+        Fingerprint an index on disk so a rebuild can be detected
+    Args:
+        folder_path: local_index_* directory
+        index_name: base name used when the index was saved
+    Returns:
+        Tuple of the generation directory, then (mtime_ns, size) for every
+        index file
+    """
+    signature = [store_dir(folder_path, index_name)]
+    for path in index_files(folder_path, index_name):
+        stat = os.stat(path)
+        signature.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+class IndexCache:
+    """
+    Keeps loaded FAISS vector stores resident so each local_index_* directory
+    is read and unpickled once per process instead of on every query.
+    Entries are reloaded when the files on disk change and the least
+    recently used entries are evicted once max_bytes is exceeded.
+    """
+
+    def __init__(self, max_bytes=INDEX_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    def _load_lock(self, key):
+        with self._lock:
+            return self._load_locks.setdefault(key, threading.Lock())
+
+    def get(self, folder_path, embeddings, index_name="index"):
+        """
+        Purpose:
+            Return the vector store for folder_path, loading it if needed
+        Args:
+            folder_path: local_index_* directory
+            embeddings: Embeddings used for queries when the index is loaded
+            index_name: base name used when the index was saved
+        Returns:
+            FAISS vector store
+        """
+        key = (os.path.abspath(folder_path), index_name)
+        signature = index_signature(folder_path, index_name)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["signature"] == signature:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["vectorstore"]
+
+        # Load outside the shared lock so one large corpus does not block
+        # queries against the others
+        with self._load_lock(key):
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry["signature"] == signature:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry["vectorstore"]
+
+            print(f"Loading index {folder_path}")
+            # Vectors are memory mapped and documents read on demand where
+            # the index was saved by vector_store.save_store
+            vectorstore = load_store(folder_path, embeddings, index_name)
+            size = sum(os.path.getsize(path) for path in index_files(folder_path, index_name))
+
+            with self._lock:
+                self.misses += 1
+                if key in self._entries:
+                    self.reloads += 1
+                self._entries[key] = {
+                    "vectorstore": vectorstore,
+                    "signature": signature,
+                    "size": size,
+                }
+                self._entries.move_to_end(key)
+                self._evict(keep=key)
+
+        return vectorstore
+
+    def signature(self, folder_path, index_name="index"):
+        """
+        Purpose:
+            Return the signature of the resident copy of an index
+        Args:
+            folder_path: local_index_* directory
+            index_name: base name used when the index was saved
+        Returns:
+            Signature tuple, or None if the index is not loaded
+        """
+        key = (os.path.abspath(folder_path), index_name)
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry["signature"] if entry is not None else None
+
+    def _evict(self, keep):
+        total = sum(entry["size"] for entry in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            print(f"Evicting index {key[0]}")
+            total -= self._entries.pop(key)["size"]
+            self.evictions += 1
+
+    def evict(self, folder_path, index_name="index"):
+        """
+        Purpose:
+            Drop an index from the cache
+        Args:
+            folder_path: local_index_* directory
+            index_name: base name used when the index was saved
+        Returns:
+            N/A
+        """
+        key = (os.path.abspath(folder_path), index_name)
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "indexes": len(self._entries),
+                "bytes": sum(entry["size"] for entry in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "evictions": self.evictions,
+            }
+
+
+# Shared by every tool in the process
+index_cache = IndexCache()
+
+
+def load_index(folder_path, embeddings, index_name="index"):
+    """
+    Purpose:
+        Drop-in replacement for FAISS.load_local backed by the shared cache,
+        which also opens indexes saved by vector_store.save_store
+    Args:
+        folder_path: local_index_* directory
+        embeddings: Embeddings used for queries when the index is loaded
+        index_name: base name used when the index was saved
+    Returns:
+        FAISS vector store
+    """
+    return index_cache.get(folder_path, embeddings, index_name)
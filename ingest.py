@@ -1,146 +1,36 @@
-import os
-import requests
-from langchain.document_loaders import SeleniumURLLoader
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.embeddings import BedrockEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.vectorstores import FAISS
-import xml.etree.ElementTree as ET
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from langchain.document_loaders import PyPDFLoader
+from corpus_ingest import ingest_corpus, main as ingest_main
 
-# Setup Chrome Driver, may need to change based on system
-service = Service("/Users/vtbloise/Downloads/chromedriver_mac64/chromedriver")
-options = Options()
-options.add_argument("--headless")
-options.add_argument("--no-sandbox")
-driver = webdriver.Chrome(service=service, options=options)
+save_loc = "local_index_ted"
 
-def extract_urls_from_sitemap(sitemap_url):
-    response = requests.get(sitemap_url)
-    if response.status_code != 200:
-        print(f"Failed to fetch sitemap: {response.status_code}")
-        return []
+# Site maps for the AWS Well-Architected Framework
+sitemap_url_list = [
+    "https://docs.aws.amazon.com/wellarchitected/latest/security-pillar/sitemap.xml",
+    "https://docs.aws.amazon.com/wellarchitected/latest/framework/sitemap.xml",
+    "https://docs.aws.amazon.com/wellarchitected/latest/operational-excellence-pillar/sitemap.xml",
+    "https://docs.aws.amazon.com/wellarchitected/latest/reliability-pillar/sitemap.xml",
+    "https://docs.aws.amazon.com/wellarchitected/latest/performance-efficiency-pillar/sitemap.xml",
+    "https://docs.aws.amazon.com/wellarchitected/latest/cost-optimization-pillar/sitemap.xml",
+    "https://docs.aws.amazon.com/wellarchitected/latest/sustainability-pillar/sitemap.xml",
+]
 
-    sitemap_content = response.content
-    root = ET.fromstring(sitemap_content)
+sitemap_url_list_ck12 = [
+    #"https://www.broadviewfcu.com/sitemap.xml",
+    "https://blog.ted.com/sitemap.xml",
+    "https://ideas.ted.com/sitemap.xml",
+]
 
-    # Extract the URLs from the sitemap
-    urls = [
-        elem.text
-        for elem in root.iter("{http://www.sitemaps.org/schemas/sitemap/0.9}loc")
-    ]
 
-    return urls
-
-def load_pdf_text(pdfs):
-    loader = PyPDFLoader(urls=pdfs)
-    data = loader.load_and_split()
-
-    #text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=20)
-    #texts = text_splitter.split_documents(data)
-
-    return data
-
-def load_html_text(sitemap_urls):
-    loader = SeleniumURLLoader(urls=sitemap_urls)
-    data = loader.load()
-
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=20)
-    texts = text_splitter.split_documents(data)
-
-    return texts
-
-def load_html_text_tester(sitemap_urls):
-    loader = SeleniumURLLoader(urls=sitemap_urls)
-    data = loader.load()
-    
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=20)
-    texts = text_splitter.split_documents(data)
-
-    return texts
-
-
-def embed_text_OpenAI(texts, save_loc):
-    embeddings = OpenAIEmbeddings(openai_api_key=os.environ["OPENAI_API_KEY"])
-    docsearch = FAISS.from_documents(texts, embeddings)
-
-    docsearch.save_local(save_loc)
-
-def embed_text_Bedrock(texts, save_loc):
-    embeddings = BedrockEmbeddings(
-        credentials_profile_name="default", region_name="us-east-1"
-    )
-    docsearch = FAISS.from_documents(texts, embeddings)
-
-    docsearch.save_local(save_loc)
-
-def embed_text_Bedrock_with_timeout_avoid_logic(texts, save_loc):
-    embeddings = BedrockEmbeddings(
-        credentials_profile_name="default", region_name="us-east-1"
-    )
-
-    # Split texts to batchs of 100, then merge each batch
-    final_db = None
-    for i in range(0, len(texts), 10):
-        # An array of i to i+50
-        print(f"Getting docs from {i} to {i+10} of {len(texts)}")
-        sample_texts = texts[i : i + 10]
-        try:
-            temp_db = FAISS.from_documents(sample_texts, embeddings)
-        except Exception as e:
-            print("Failed o well")
-            continue
-
-        if i == 0:
-            final_db = temp_db
-
-        if i > 0:
-            final_db.merge_from(temp_db)
-
-    final_db.save_local(save_loc)
-
-
-def main() -> None:
+def main(**options) -> None:
     """
     Purpose:
         Ingest data into a a local db
     Args:
-        N/A
+        options: see corpus_ingest.ingest_corpus
     Returns:
         N/A
     """
-    # Site maps for the AWS Well-Architected Framework
-    sitemap_url_list = [
-        "https://docs.aws.amazon.com/wellarchitected/latest/security-pillar/sitemap.xml",
-        "https://docs.aws.amazon.com/wellarchitected/latest/framework/sitemap.xml",
-        "https://docs.aws.amazon.com/wellarchitected/latest/operational-excellence-pillar/sitemap.xml",
-        "https://docs.aws.amazon.com/wellarchitected/latest/reliability-pillar/sitemap.xml",
-        "https://docs.aws.amazon.com/wellarchitected/latest/performance-efficiency-pillar/sitemap.xml",
-        "https://docs.aws.amazon.com/wellarchitected/latest/cost-optimization-pillar/sitemap.xml",
-        "https://docs.aws.amazon.com/wellarchitected/latest/sustainability-pillar/sitemap.xml",
-    ]
-
-    sitemap_url_list_ck12 = [
-        #"https://www.broadviewfcu.com/sitemap.xml",
-        "https://blog.ted.com/sitemap.xml",
-        "https://ideas.ted.com/sitemap.xml",
-    ]
-
-    # Get all links from the sitemaps
-    full_sitemap_list = []
-    for sitemap in sitemap_url_list_ck12:#sitemap_url_list:
-        full_sitemap_list.extend(extract_urls_from_sitemap(sitemap))
-
-    print(full_sitemap_list)
-    # get the raw html text
-    texts = load_html_text(full_sitemap_list)
-    # print(texts)
-    # Save embeddings to local_index
-    embed_text_Bedrock_with_timeout_avoid_logic(texts, "local_index_ted")
+    ingest_corpus(save_loc, sitemap_url_list_ck12, **options)#sitemap_url_list
 
 
 if __name__ == "__main__":
-    main()
+    ingest_main(save_loc, sitemap_url_list_ck12)
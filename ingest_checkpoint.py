@@ -0,0 +1,312 @@
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+from langchain.docstore.document import Document
+
+# Indexed chunks are appended to disk after this many new embeddings
+CHECKPOINT_FLUSH_EVERY = 100
+
+
+class IngestCheckpoint:
+    """
+    Work directory that lets an interrupted ingest resume where it stopped.
+    Chunks are recorded as they are indexed, and a page (or other input
+    unit) is marked done only after all of its chunks have been written.
+
+    chunks.jsonl    indexed chunks with the key of the page they came from
+    vectors.bin     float32 vectors, one row per line of chunks.jsonl
+    failed.jsonl    chunks that could not be embedded
+    blocks.jsonl    boilerplate block digests of each page, see ChunkDeduplicator
+    done.txt        keys of pages whose chunks are all written
+    progress.json   vector dimension
+    compact.json    present while compacted files are being swapped in
+
+    Opening the directory cuts off whatever a crash left half written, and
+    drops the rows of pages that were not finished: those pages are fetched
+    again, so their rows would otherwise be recorded twice.
+    """
+
+    def __init__(self, work_dir, flush_every=CHECKPOINT_FLUSH_EVERY):
+        self.work_dir = work_dir
+        self.flush_every = flush_every
+        os.makedirs(work_dir, exist_ok=True)
+        self._chunks = []
+        self._vectors = []
+        self._failed = []
+        self._blocks = []
+        self._done = []
+        self._lock = threading.Lock()
+        self.progress = {"dim": None}
+        if os.path.exists(self._path("progress.json")):
+            with open(self._path("progress.json")) as f:
+                self.progress = json.load(f)
+        # Finish a compaction a crash interrupted before checking the files
+        if os.path.exists(self._path("compact.json")):
+            self._swap_compacted()
+        self._repair()
+        self._compact()
+
+    def _path(self, name):
+        return os.path.join(self.work_dir, name)
+
+    @staticmethod
+    def _complete_lines(path, limit=None):
+        # (lines, bytes) of the longest prefix of at most limit complete lines
+        lines = end = offset = 0
+        if not os.path.exists(path):
+            return lines, end
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                if limit is not None and lines >= limit:
+                    break
+                start = 0
+                while limit is None or lines < limit:
+                    start = block.find(b"\n", start) + 1
+                    if not start:
+                        break
+                    lines += 1
+                    end = offset + start
+                offset += len(block)
+        return lines, end
+
+    def _truncate(self, name, size) -> None:
+        path = self._path(name)
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            with open(path, "r+b") as f:
+                f.truncate(size)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _repair(self) -> None:
+        # A crash between or during the appends of _flush leaves a torn last
+        # line or vector rows without their chunk. Cut every file back to
+        # its longest consistent prefix, so appends of this run line up
+        rows = 0
+        row_bytes = 4 * (self.progress["dim"] or 0)
+        if row_bytes and os.path.exists(self._path("vectors.bin")):
+            rows = os.path.getsize(self._path("vectors.bin")) // row_bytes
+        rows, end = self._complete_lines(self._path("chunks.jsonl"), rows)
+        self._truncate("chunks.jsonl", end)
+        self._truncate("vectors.bin", rows * row_bytes)
+        for name in ("failed.jsonl", "blocks.jsonl", "done.txt"):
+            self._truncate(name, self._complete_lines(self._path(name))[1])
+
+    def _compact(self) -> None:
+        # chunks.jsonl and vectors.bin are rewritten side by side and only
+        # swapped in once compact.json says both copies are complete, so a
+        # crash in between is rolled forward on the next open
+        for name in ("chunks.jsonl.tmp", "vectors.bin.tmp", "failed.jsonl.tmp", "blocks.jsonl.tmp"):
+            if os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+        done = self.done_keys()
+
+        if self._unfinished_rows("chunks.jsonl", done):
+            row_bytes = 4 * self.progress["dim"]
+            with open(self._path("chunks.jsonl")) as chunks, open(self._path("vectors.bin"), "rb") as vectors, open(
+                self._path("chunks.jsonl.tmp"), "w"
+            ) as chunks_out, open(self._path("vectors.bin.tmp"), "wb") as vectors_out:
+                for line in chunks:
+                    vector = vectors.read(row_bytes)
+                    if json.loads(line)["key"] in done:
+                        chunks_out.write(line)
+                        vectors_out.write(vector)
+                for f in (chunks_out, vectors_out):
+                    f.flush()
+                    os.fsync(f.fileno())
+            with open(self._path("compact.json.tmp"), "w") as f:
+                json.dump({"files": ["vectors.bin", "chunks.jsonl"]}, f)
+            os.replace(self._path("compact.json.tmp"), self._path("compact.json"))
+            self._swap_compacted()
+
+        for name in ("failed.jsonl", "blocks.jsonl"):
+            if self._unfinished_rows(name, done):
+                with open(self._path(name)) as f, open(self._path(name + ".tmp"), "w") as out:
+                    out.writelines(line for line in f if json.loads(line)["key"] in done)
+                    out.flush()
+                    os.fsync(out.fileno())
+                os.replace(self._path(name + ".tmp"), self._path(name))
+
+    def _unfinished_rows(self, name, done):
+        if not os.path.exists(self._path(name)):
+            return False
+        with open(self._path(name)) as f:
+            return any(json.loads(line)["key"] not in done for line in f)
+
+    def _swap_compacted(self) -> None:
+        with open(self._path("compact.json")) as f:
+            files = json.load(f)["files"]
+        for name in files:
+            if os.path.exists(self._path(name + ".tmp")):
+                os.replace(self._path(name + ".tmp"), self._path(name))
+        os.remove(self._path("compact.json"))
+
+    def _write_progress(self, **updates):
+        self.progress.update(updates)
+        tmp = self._path("progress.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.progress, f)
+        os.replace(tmp, self._path("progress.json"))
+
+    @staticmethod
+    def _append(path, data, mode="a"):
+        with open(path, mode) as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def done_keys(self):
+        """
+        Purpose:
+            Keys of the pages a previous run fully indexed
+        Args:
+            N/A
+        Returns:
+            Set of keys
+        """
+        if not os.path.exists(self._path("done.txt")):
+            return set()
+        with open(self._path("done.txt")) as f:
+            # Only newline-terminated lines were completely written
+            return {line[:-1] for line in f if line.endswith("\n")}
+
+    def add_chunk(self, key, doc, vector) -> None:
+        with self._lock:
+            self._chunks.append({"key": key, "page_content": doc.page_content, "metadata": doc.metadata})
+            self._vectors.append(vector)
+            if len(self._chunks) >= self.flush_every:
+                self._flush()
+
+    def add_failed(self, key, doc) -> None:
+        with self._lock:
+            self._failed.append({"key": key, "page_content": doc.page_content, "metadata": doc.metadata})
+
+    def add_blocks(self, key, blocks) -> None:
+        with self._lock:
+            self._blocks.append({"key": key, "blocks": blocks})
+
+    def complete(self, key) -> None:
+        with self._lock:
+            self._done.append(key)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        # Chunks and vectors go to disk before the keys that vouch for them
+        if self._chunks:
+            if self.progress["dim"] is None:
+                self._write_progress(dim=len(self._vectors[0]))
+            self._append(self._path("vectors.bin"), np.asarray(self._vectors, dtype="<f4").tobytes(), "ab")
+            self._append(
+                self._path("chunks.jsonl"), "".join(json.dumps(chunk) + "\n" for chunk in self._chunks)
+            )
+            self._chunks = []
+            self._vectors = []
+        if self._failed:
+            self._append(
+                self._path("failed.jsonl"), "".join(json.dumps(chunk) + "\n" for chunk in self._failed)
+            )
+            self._failed = []
+        if self._blocks:
+            self._append(
+                self._path("blocks.jsonl"), "".join(json.dumps(blocks) + "\n" for blocks in self._blocks)
+            )
+            self._blocks = []
+        if self._done:
+            self._append(self._path("done.txt"), "".join(key + "\n" for key in self._done))
+            self._done = []
+
+    def load(self):
+        """
+        Purpose:
+            Return the chunks of every page a previous run fully indexed
+        Args:
+            N/A
+        Returns:
+            Tuple of (list of (key, Document), float32 array of vectors)
+        """
+        dim = self.progress["dim"]
+        if dim is None or not os.path.exists(self._path("chunks.jsonl")):
+            return [], None
+        done = self.done_keys()
+
+        with open(self._path("vectors.bin"), "rb") as f:
+            data = f.read()
+        row_bytes = dim * 4
+        vectors = np.frombuffer(data[: len(data) - len(data) % row_bytes], dtype="<f4").reshape(-1, dim)
+
+        chunks = []
+        rows = []
+        with open(self._path("chunks.jsonl")) as f:
+            for row, line in enumerate(f):
+                # Stop at a torn last line or a row whose vector never landed
+                if row >= len(vectors) or not line.endswith("\n"):
+                    break
+                record = json.loads(line)
+                if record["key"] in done:
+                    chunks.append(
+                        (record["key"], Document(page_content=record["page_content"], metadata=record["metadata"]))
+                    )
+                    rows.append(row)
+        return chunks, np.array(vectors[rows], dtype=np.float32)
+
+    def load_failed(self):
+        """
+        Purpose:
+            Return the chunks of fully indexed pages that failed to embed
+        Args:
+            N/A
+        Returns:
+            List of (key, Document)
+        """
+        if not os.path.exists(self._path("failed.jsonl")):
+            return []
+        done = self.done_keys()
+        failed = []
+        with open(self._path("failed.jsonl")) as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                record = json.loads(line)
+                if record["key"] in done:
+                    failed.append(
+                        (record["key"], Document(page_content=record["page_content"], metadata=record["metadata"]))
+                    )
+        return failed
+
+    def load_blocks(self):
+        """
+        Purpose:
+            Return the boilerplate block digests of fully indexed pages
+        Args:
+            N/A
+        Returns:
+            Dict of key -> digests, as ChunkDeduplicator.boilerplate_state
+        """
+        if not os.path.exists(self._path("blocks.jsonl")):
+            return {}
+        done = self.done_keys()
+        blocks = {}
+        with open(self._path("blocks.jsonl")) as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                record = json.loads(line)
+                if record["key"] in done:
+                    blocks[record["key"]] = record["blocks"]
+        return blocks
+
+    def clear(self) -> None:
+        """
+        Purpose:
+            Remove the work directory once the index has been saved
+        Args:
+            N/A
+        Returns:
+            N/A
+        """
+        shutil.rmtree(self.work_dir, ignore_errors=True)
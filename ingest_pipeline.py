@@ -0,0 +1,281 @@
+import queue
+import threading
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain.docstore.in_memory import InMemoryDocstore
+from langchain.vectorstores import FAISS
+from langchain.vectorstores.faiss import dependable_faiss_import
+
+from embedding_pipeline import (
+    EMBED_MAX_RETRIES,
+    EMBED_MAX_WORKERS,
+    EMBED_REQUESTS_PER_SECOND,
+    AdaptiveLimiter,
+    TokenBucket,
+    embed_with_retry,
+)
+from page_fetcher import FETCH_WORKERS
+
+# Pages buffered between fetching and splitting; chunk and vector buffers
+# are CHUNKS_PER_PAGE times larger
+PIPELINE_QUEUE_SIZE = 32
+CHUNKS_PER_PAGE = 8
+# Vectors added to the FAISS index at a time
+INDEX_BATCH_SIZE = 256
+
+_DONE = object()
+
+
+class IndexWriter:
+    """
+    Builds a FAISS vector store by appending vectors in batches as they
+    arrive, so no stage has to hold the whole corpus before indexing. The
+    store itself is in memory: it holds every chunk and vector until it is
+    saved.
+    """
+
+    def __init__(self, embeddings, batch_size=INDEX_BATCH_SIZE):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.index = None
+        self.docstore = InMemoryDocstore({})
+        self.index_to_docstore_id = {}
+        self._documents = []
+        self._vectors = []
+
+    def add(self, doc, vector) -> None:
+        self._documents.append(doc)
+        self._vectors.append(vector)
+        if len(self._vectors) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._vectors:
+            return
+        vectors = np.asarray(self._vectors, dtype=np.float32)
+        if self.index is None:
+            self.index = dependable_faiss_import().IndexFlatL2(vectors.shape[1])
+        start = self.index.ntotal
+        self.index.add(vectors)
+        ids = [str(uuid.uuid4()) for _ in self._documents]
+        self.docstore.add(dict(zip(ids, self._documents)))
+        self.index_to_docstore_id.update({start + i: _id for i, _id in enumerate(ids)})
+        self._documents = []
+        self._vectors = []
+
+    def vectorstore(self):
+        self.flush()
+        if self.index is None:
+            raise ValueError("No chunks could be embedded")
+        return FAISS(self.embeddings.embed_query, self.index, self.docstore, self.index_to_docstore_id)
+
+
+def document_key(doc, position):
+    """
+    Purpose:
+        Checkpoint key for a document fed in directly rather than fetched
+    Args:
+        doc: page Document, e.g. a PDF page
+        position: its position in the input list, used when the document
+            has no page number
+    Returns:
+        Key string
+    """
+    if "page" in doc.metadata:
+        return f"{doc.metadata.get('source', '')}#page={doc.metadata['page']}"
+    return f"{doc.metadata.get('source', '')}#{position}"
+
+
+def run_ingest_pipeline(
+    urls,
+    fetch_page,
+    split_documents,
+    embeddings,
+    checkpoint=None,
+    documents=(),
+    dedup=None,
+    fetch_workers=FETCH_WORKERS,
+    embed_workers=EMBED_MAX_WORKERS,
+    requests_per_second=EMBED_REQUESTS_PER_SECOND,
+    queue_size=PIPELINE_QUEUE_SIZE,
+):
+    """
+    Purpose:
+        Stream pages through fetch -> split -> embed -> index stages that run
+        concurrently and are connected by bounded queues, so memory does
+        not grow with the number of pages waiting for the next stage. The
+        index being built does grow with the corpus, see IndexWriter
+    Args:
+        urls: page URLs to fetch
+        fetch_page: function taking a URL and returning a Document or None
+        split_documents: function splitting a list of Documents into chunks
+        embeddings: Embeddings client
+        checkpoint: optional IngestCheckpoint; pages it already holds are
+            skipped and new chunks are recorded as they are indexed
+        documents: iterable of page Documents (e.g. PDF pages, possibly a
+            generator still loading them) that should be split and
+            embedded with the fetched pages
+        dedup: optional ChunkDeduplicator that strips boilerplate from
+            pages and drops duplicate chunks before they are embedded; it
+            may already hold the boilerplate_state of an earlier run, and
+            holds that of this run afterwards
+        fetch_workers: pages fetched at once
+        embed_workers: upper bound on embedding requests in flight
+        requests_per_second: embedding request rate
+        queue_size: pages buffered between fetching and splitting
+    Returns:
+        Tuple of (FAISS vector store, list of chunk Documents that failed,
+        set of the keys of every page indexed, this run or before it: URLs
+        for fetched pages, see document_key for the others)
+    """
+    writer = IndexWriter(embeddings)
+    failed = []
+    done = set()
+    if checkpoint is not None:
+        done = checkpoint.done_keys()
+    completed = set(done)
+    if checkpoint is not None:
+        chunks, vectors = checkpoint.load()
+        for (_, doc), vector in zip(chunks, vectors if vectors is not None else []):
+            writer.add(doc, vector)
+            if dedup is not None:
+                dedup.add(doc)
+        failed.extend(doc for _, doc in checkpoint.load_failed())
+        if dedup is not None:
+            dedup.load_boilerplate_state(checkpoint.load_blocks())
+        if done:
+            print(f"Resuming: {len(done)} pages and {len(chunks)} chunks already indexed")
+
+    pages_q = queue.Queue(maxsize=queue_size)
+    chunks_q = queue.Queue(maxsize=queue_size * CHUNKS_PER_PAGE)
+    results_q = queue.Queue(maxsize=queue_size * CHUNKS_PER_PAGE)
+    limiter = AdaptiveLimiter(embed_workers)
+    bucket = TokenBucket(requests_per_second)
+
+    def fetch_one(url):
+        try:
+            doc = fetch_page(url)
+        except Exception as e:
+            print(f"Failed to fetch {url}: {e}")
+            return
+        if doc is not None:
+            pages_q.put((url, doc))
+
+    def fetch_stage():
+        try:
+            with ThreadPoolExecutor(max_workers=fetch_workers) as executor:
+                list(executor.map(fetch_one, [url for url in dict.fromkeys(urls) if url not in done]))
+        finally:
+            pages_q.put(_DONE)
+
+    def documents_stage():
+        # Runs alongside fetching, so documents that are still being loaded
+        # (e.g. PDFs extracted in a process pool) overlap with the fetches
+        try:
+            for position, doc in enumerate(documents):
+                key = document_key(doc, position)
+                if key not in done:
+                    pages_q.put((key, doc))
+        except Exception as e:
+            print(f"Failed to load documents: {e}")
+        finally:
+            pages_q.put(_DONE)
+
+    def split_stage():
+        producers = 2
+        while True:
+            item = pages_q.get()
+            if item is _DONE:
+                producers -= 1
+                if producers == 0:
+                    break
+                continue
+            key, page = item
+            try:
+                if dedup is not None:
+                    page = dedup.strip_boilerplate(page, key)
+                    if checkpoint is not None:
+                        checkpoint.add_blocks(key, dedup.page_blocks(key))
+                chunks = split_documents([page])
+                if dedup is not None:
+                    chunks = dedup.filter(chunks)
+            except Exception as e:
+                print(f"Failed to split {key}: {e}")
+                continue
+            # The index stage marks the page done once it has seen this many chunks
+            results_q.put(("page", key, len(chunks)))
+            for chunk in chunks:
+                chunks_q.put((key, chunk))
+        for _ in range(embed_workers):
+            chunks_q.put(_DONE)
+
+    def embed_stage():
+        while True:
+            item = chunks_q.get()
+            if item is _DONE:
+                results_q.put(_DONE)
+                break
+            key, chunk = item
+            try:
+                vector = embed_with_retry(chunk.page_content, embeddings, limiter, bucket, EMBED_MAX_RETRIES)
+            except Exception as e:
+                print(f"Failed to embed chunk of {key}: {e}")
+                vector = None
+            results_q.put(("chunk", key, chunk, vector))
+
+    threads = [
+        threading.Thread(target=fetch_stage, daemon=True),
+        threading.Thread(target=documents_stage, daemon=True),
+        threading.Thread(target=split_stage, daemon=True),
+    ]
+    threads += [threading.Thread(target=embed_stage, daemon=True) for _ in range(embed_workers)]
+    for thread in threads:
+        thread.start()
+
+    # Index stage runs on the calling thread
+    expected = {}
+    received = defaultdict(int)
+    pages_done = 0
+    chunks_done = 0
+    finished = 0
+    while finished < embed_workers:
+        item = results_q.get()
+        if item is _DONE:
+            finished += 1
+            continue
+        if item[0] == "page":
+            _, key, count = item
+            expected[key] = count
+        else:
+            _, key, chunk, vector = item
+            received[key] += 1
+            chunks_done += 1
+            if vector is None:
+                failed.append(chunk)
+                if checkpoint is not None:
+                    checkpoint.add_failed(key, chunk)
+            else:
+                writer.add(chunk, vector)
+                if checkpoint is not None:
+                    checkpoint.add_chunk(key, chunk, vector)
+        if key in expected and received[key] == expected[key]:
+            del expected[key]
+            received.pop(key, None)
+            pages_done += 1
+            completed.add(key)
+            if checkpoint is not None:
+                checkpoint.complete(key)
+            if pages_done % 50 == 0:
+                print(f"Indexed {pages_done} pages, {chunks_done} chunks")
+
+    for thread in threads:
+        thread.join()
+    if checkpoint is not None:
+        checkpoint.flush()
+    print(f"Indexed {pages_done} pages, {chunks_done} chunks, {len(failed)} chunks failed")
+    if dedup is not None:
+        dedup.report()
+    return writer.vectorstore(), failed, completed
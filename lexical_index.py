@@ -0,0 +1,120 @@
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+# Written next to index.faiss by vector_store.save_store
+LEXICAL_SUFFIX = ".bm25.npz"
+# BM25 term-frequency saturation and document-length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Keeps product names, acronyms and codes such as ec2, s3 or l1 whole
+_TOKEN = re.compile(r"\w+")
+
+
+def lexical_path(folder_path, index_name="index"):
+    return os.path.join(folder_path, index_name + LEXICAL_SUFFIX)
+
+
+def tokenize(text):
+    return _TOKEN.findall(text.casefold())
+
+
+def write_lexical_index(path, documents) -> None:
+    """
+    Purpose:
+        Build a BM25 inverted index over documents and save it
+    Args:
+        path: index file, replaced atomically
+        documents: Documents in index order; postings refer to their rows
+    Returns:
+        N/A
+    """
+    vocabulary = {}
+    term_ids, rows, frequencies, lengths = [], [], [], []
+    for row, doc in enumerate(documents):
+        tokens = tokenize(doc.page_content)
+        lengths.append(len(tokens))
+        for term, frequency in Counter(tokens).items():
+            term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+            rows.append(row)
+            frequencies.append(frequency)
+    term_ids = np.array(term_ids, dtype=np.int64)
+    # Stable sort keeps each posting list in row order
+    order = np.argsort(term_ids, kind="stable")
+    offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)))
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez_compressed(
+            f,
+            terms=np.frombuffer("\n".join(vocabulary).encode("utf-8"), dtype=np.uint8),
+            offsets=offsets,
+            rows=np.array(rows, dtype=np.uint32)[order],
+            frequencies=np.minimum(np.array(frequencies, dtype=np.int64), 0xFFFF).astype(np.uint16)[order],
+            lengths=np.array(lengths, dtype=np.uint32),
+        )
+    os.replace(tmp, path)
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over the chunks of one corpus, keyed by their row in
+    the FAISS index. Posting lists are stored as flat arrays sliced by term,
+    so scoring a query is a handful of vectorized numpy operations.
+    """
+
+    def __init__(self, terms, offsets, rows, frequencies, lengths, k1=BM25_K1, b=BM25_B):
+        self.vocabulary = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.rows = rows
+        self.frequencies = frequencies.astype(np.float32)
+        self.size = len(lengths)
+        self.k1 = k1
+        avg_length = lengths.mean() if self.size else 1.0
+        # Length part of the BM25 denominator, computed once per chunk
+        self._norms = (k1 * (1 - b + b * lengths / (avg_length or 1.0))).astype(np.float32)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            terms = data["terms"].tobytes().decode("utf-8")
+            return cls(
+                terms.split("\n") if terms else [],
+                data["offsets"],
+                data["rows"],
+                data["frequencies"],
+                data["lengths"],
+            )
+
+    def search(self, query, k=4):
+        """
+        Purpose:
+            Rank chunks against a query with BM25
+        Args:
+            query: query text
+            k: rows to return
+        Returns:
+            List of (row, score), best first; only chunks sharing a term
+            with the query are returned
+        """
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            rows = self.rows[start:end]
+            frequencies = self.frequencies[start:end]
+            df = end - start
+            idf = np.log(1 + (self.size - df + 0.5) / (df + 0.5))
+            # Rows are unique within a posting list
+            scores[rows] += idf * frequencies * (self.k1 + 1) / (frequencies + self._norms[rows])
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k)[:k]]
+        hits = hits[np.argsort(-scores[hits])]
+        return [(int(row), float(scores[row])) for row in hits]
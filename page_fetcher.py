@@ -0,0 +1,259 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from langchain.docstore.document import Document
+
+# Pages fetched at once
+FETCH_WORKERS = 16
+# Headless browsers kept for pages that need JavaScript
+BROWSER_WORKERS = 2
+# Requests in flight to any one host
+PER_HOST_LIMIT = 4
+FETCH_TIMEOUT = 20
+# Static HTML that yields less text than this is rendered in a browser
+MIN_STATIC_TEXT = 500
+JAVASCRIPT_MARKERS = (
+    "enable javascript",
+    "javascript is required",
+    "javascript is disabled",
+    "requires javascript",
+)
+
+
+def html_to_text(html):
+    """
+    Purpose:
+        Extract text the same way SeleniumURLLoader does
+    Args:
+        html: page source
+    Returns:
+        Text of the page elements separated by blank lines
+    """
+    from unstructured.partition.html import partition_html
+
+    elements = partition_html(text=html)
+    return "\n\n".join([str(el) for el in elements])
+
+
+def needs_browser(html, text):
+    """
+    Purpose:
+        Guess whether a page only renders its content with JavaScript
+    Args:
+        html: page source from a plain HTTP request
+        text: text extracted from it
+    Returns:
+        True if the page should be rendered in a browser
+    """
+    if len(text) < MIN_STATIC_TEXT:
+        return True
+    lowered = html.lower()
+    return any(marker in lowered for marker in JAVASCRIPT_MARKERS) and len(text) < 4 * MIN_STATIC_TEXT
+
+
+class BrowserPool:
+    """
+    Up to `size` headless Chrome instances, started on first use and reused
+    across pages. A browser that errors is discarded and replaced.
+    """
+
+    def __init__(self, size=BROWSER_WORKERS, chromedriver_path=None, timeout=FETCH_TIMEOUT):
+        self.size = size
+        self.chromedriver_path = chromedriver_path
+        self.timeout = timeout
+        self._idle = []
+        self._started = 0
+        # Waiters wake when a browser is returned or discarded, so a failed
+        # browser frees its slot for a replacement
+        self._available = threading.Condition()
+
+    def _start_driver(self):
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.chrome.service import Service
+
+        options = Options()
+        options.add_argument("--headless")
+        options.add_argument("--no-sandbox")
+        if self.chromedriver_path:
+            driver = webdriver.Chrome(service=Service(self.chromedriver_path), options=options)
+        else:
+            driver = webdriver.Chrome(options=options)
+        driver.set_page_load_timeout(self.timeout)
+        return driver
+
+    def _acquire(self):
+        with self._available:
+            while not self._idle and self._started >= self.size:
+                self._available.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._started += 1
+        try:
+            return self._start_driver()
+        except Exception:
+            self._discard()
+            raise
+
+    def _discard(self, driver=None) -> None:
+        try:
+            if driver is not None:
+                driver.quit()
+        finally:
+            with self._available:
+                self._started -= 1
+                self._available.notify()
+
+    def render(self, url):
+        """
+        Purpose:
+            Load a page in a browser and return the rendered source
+        Args:
+            url: page URL
+        Returns:
+            Page source
+        """
+        driver = self._acquire()
+        try:
+            driver.get(url)
+            html = driver.page_source
+        except Exception:
+            self._discard(driver)
+            raise
+        with self._available:
+            self._idle.append(driver)
+            self._available.notify()
+        return html
+
+    def close(self) -> None:
+        with self._available:
+            idle, self._idle = self._idle, []
+            self._started -= len(idle)
+            self._available.notify_all()
+        for driver in idle:
+            driver.quit()
+
+
+class PageFetcher:
+    """
+    Fetches pages in parallel. Every page is first requested over plain
+    HTTP through pooled keep-alive sessions; only pages whose static HTML
+    has too little text, or that could not be reached (connection error or
+    timeout), are rendered in the browser pool. Pages answered with an
+    HTTP error status fail. Requests to a single host are capped at
+    per_host_limit.
+    """
+
+    def __init__(
+        self,
+        workers=FETCH_WORKERS,
+        browser_workers=BROWSER_WORKERS,
+        per_host_limit=PER_HOST_LIMIT,
+        timeout=FETCH_TIMEOUT,
+        chromedriver_path=None,
+        use_browser=True,
+    ):
+        self.workers = workers
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.browsers = BrowserPool(browser_workers, chromedriver_path, timeout) if use_browser else None
+        self._local = threading.local()
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self.static_pages = 0
+        self.browser_pages = 0
+        self.failed_pages = 0
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.per_host_limit, pool_maxsize=self.per_host_limit)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["User-Agent"] = "Mozilla/5.0 (compatible; GenAIApplication ingest)"
+            self._local.session = session
+        return session
+
+    def _host_limit(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            return self._hosts.setdefault(host, threading.BoundedSemaphore(self.per_host_limit))
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def fetch_one(self, url):
+        """
+        Purpose:
+            Fetch one page, falling back to a browser when needed
+        Args:
+            url: page URL
+        Returns:
+            Document with the page text, or None if the page failed
+        """
+        with self._host_limit(url):
+            try:
+                response = self._session().get(url, timeout=self.timeout)
+                response.raise_for_status()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                print(f"Plain fetch failed for {url}: {e}")
+                response = None
+            except Exception as e:
+                # An error status (404, 403, 500...) is the site's answer for
+                # the page, a browser would be given the same one
+                print(f"Failed to fetch {url}: {e}")
+                self._count("failed_pages")
+                return None
+
+            if response is not None:
+                if "html" not in response.headers.get("Content-Type", "html"):
+                    print(f"Skipping {url}: not HTML")
+                    self._count("failed_pages")
+                    return None
+                try:
+                    text = html_to_text(response.text)
+                except Exception as e:
+                    print(f"Failed to extract the text of {url}: {e}")
+                    self._count("failed_pages")
+                    return None
+                if not needs_browser(response.text, text) or self.browsers is None:
+                    self._count("static_pages")
+                    return Document(page_content=text, metadata={"source": url})
+
+            if self.browsers is None:
+                self._count("failed_pages")
+                return None
+            try:
+                text = html_to_text(self.browsers.render(url))
+            except Exception as e:
+                print(f"Browser fetch failed for {url}: {e}")
+                self._count("failed_pages")
+                return None
+            self._count("browser_pages")
+            return Document(page_content=text, metadata={"source": url})
+
+    def fetch(self, urls):
+        """
+        Purpose:
+            Fetch pages in parallel
+        Args:
+            urls: list of page URLs
+        Returns:
+            List of Documents for the pages that could be fetched, in URL order
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            documents = list(executor.map(self.fetch_one, urls))
+        print(
+            f"Fetched {self.static_pages} pages over HTTP, {self.browser_pages} in a browser, "
+            f"{self.failed_pages} failed so far"
+        )
+        return [doc for doc in documents if doc is not None]
+
+    def close(self) -> None:
+        if self.browsers is not None:
+            self.browsers.close()
@@ -0,0 +1,95 @@
+import glob
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from langchain.docstore.document import Document
+
+# PDFs extracted at once, each in its own process
+PDF_WORKERS = min(8, os.cpu_count() or 1)
+
+
+def resolve_pdf_sources(sources):
+    """
+    Purpose:
+        Expand directories and glob patterns into a list of PDFs
+    Args:
+        sources: PDF URLs, file paths, directories (searched recursively)
+            or glob patterns
+    Returns:
+        List of PDF URLs and file paths, without duplicates
+    """
+    resolved = []
+    for source in sources:
+        if source.startswith(("http://", "https://")):
+            resolved.append(source)
+        elif os.path.isdir(source):
+            resolved.extend(sorted(glob.glob(os.path.join(source, "**", "*.pdf"), recursive=True)))
+        elif glob.has_magic(source):
+            resolved.extend(sorted(glob.glob(source, recursive=True)))
+        else:
+            resolved.append(source)
+    return list(dict.fromkeys(resolved))
+
+
+def extract_pdf_pages(source):
+    """
+    Purpose:
+        Extract the text of every page of one PDF; runs in a worker process
+    Args:
+        source: PDF URL or file path
+    Returns:
+        List of page Documents whose metadata has the original source and
+        the page number
+    """
+    from langchain.document_loaders import PyPDFLoader
+
+    try:
+        loader = PyPDFLoader(source)
+        pages = loader.load()
+    except Exception as e:
+        print(f"Failed to load PDF {source}: {e}")
+        return []
+    # Downloaded PDFs report their temp file as the source
+    return [
+        Document(page_content=page.page_content, metadata={"source": source, "page": page.metadata["page"]})
+        for page in pages
+        if page.page_content.strip()
+    ]
+
+
+def iter_pdf_pages(sources, workers=PDF_WORKERS):
+    """
+    Purpose:
+        Extract PDF pages across a process pool, yielding them as each file
+        finishes so they can be streamed into the ingest pipeline
+    Args:
+        sources: PDF URLs, file paths, directories or glob patterns
+        workers: worker processes
+    Returns:
+        Generator of page Documents, in source order
+    """
+    pdfs = resolve_pdf_sources(sources)
+    if not pdfs:
+        return
+    # Spawned, not forked: the pool starts while pipeline threads may hold
+    # import, SSL or queue locks that a forked child would inherit locked
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(pdfs)), mp_context=context) as executor:
+        for pages in executor.map(extract_pdf_pages, pdfs):
+            yield from pages
+
+
+def load_pdfs(sources, workers=PDF_WORKERS):
+    """
+    Purpose:
+        Extract the pages of many PDFs in parallel
+    Args:
+        sources: PDF URLs, file paths, directories or glob patterns
+        workers: worker processes
+    Returns:
+        List of page Documents
+    """
+    pages = list(iter_pdf_pages(sources, workers))
+    print(f"Loaded {len(pages)} PDF pages")
+    return pages
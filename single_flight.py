@@ -0,0 +1,138 @@
+import threading
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent requests: the first request for a key
+    runs, requests for the same key that arrive while it is in flight wait
+    for it and receive its result (or its exception) instead of running
+    again.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, hold=False):
+        """
+        Purpose:
+            Run fn once for all concurrent callers with the same key
+        Args:
+            key: hashable request key
+            fn: callable without arguments doing the work
+            hold: keep sharing the result after fn returns, until
+                release(key) is called; for results that are still being
+                produced, such as a SharedStream
+        Returns:
+            The result of fn
+        """
+        with self._lock:
+            self.requests += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.executed += 1
+            else:
+                flight.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+        except BaseException as e:
+            flight.error = e
+            hold = False
+            raise
+        finally:
+            flight.done.set()
+            if not hold:
+                self.release(key, flight)
+        return flight.result
+
+    def release(self, key, flight=None) -> None:
+        with self._lock:
+            if flight is None or self._flights.get(key) is flight:
+                self._flights.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._flights),
+            }
+
+    def report(self) -> None:
+        stats = self.stats()
+        print(
+            f"Coalesced {stats['coalesced']} of {stats['requests']} requests; each skipped its own retrieval, "
+            f"query embedding and generation"
+        )
+
+
+class SharedStream:
+    """
+    Fans one generator out to any number of readers. A background thread
+    drains the generator into a buffer and every reader sees every chunk
+    from the start, however late it begins reading.
+    """
+
+    def __init__(self, source, on_done=None):
+        self._chunks = []
+        self._finished = False
+        self._error = None
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, args=(source, on_done), daemon=True)
+        self._thread.start()
+
+    def _run(self, source, on_done):
+        try:
+            for chunk in source:
+                with self._cond:
+                    self._chunks.append(chunk)
+                    self._cond.notify_all()
+        except Exception as e:
+            self._error = e
+        finally:
+            with self._cond:
+                self._finished = True
+                self._cond.notify_all()
+            if on_done is not None:
+                on_done()
+
+    def __iter__(self):
+        position = 0
+        while True:
+            with self._cond:
+                while position >= len(self._chunks) and not self._finished:
+                    self._cond.wait()
+                if position < len(self._chunks):
+                    chunk = self._chunks[position]
+                    position += 1
+                elif self._error is not None:
+                    raise self._error
+                else:
+                    return
+            yield chunk
+
+
+# Shared by every tool in the process
+request_coalescer = SingleFlight()
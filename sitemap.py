@@ -0,0 +1,194 @@
+import gzip
+import re
+import xml.etree.ElementTree as ET
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Child sitemaps fetched at once
+SITEMAP_WORKERS = 8
+SITEMAP_TIMEOUT = 30
+
+
+def _local_name(tag):
+    # Sitemaps are not always namespaced, so match on the local tag name
+    return tag.rsplit("}", 1)[-1]
+
+
+class _PeekedStream:
+    """
+    Replays bytes read ahead (to sniff gzip) before the rest of a stream.
+    """
+
+    def __init__(self, head, stream):
+        self.head = head
+        self.stream = stream
+
+    def read(self, size=-1):
+        if not self.head:
+            return self.stream.read(size)
+        if size is None or size < 0:
+            data, self.head = self.head + self.stream.read(), b""
+            return data
+        data, self.head = self.head[:size], self.head[size:]
+        return data
+
+    def close(self) -> None:
+        self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_sitemap(location, session, timeout=SITEMAP_TIMEOUT):
+    """
+    Purpose:
+        Open a sitemap URL or local file as a stream, decompressing gzip
+    Args:
+        location: http(s) URL or local path, optionally .xml.gz
+        session: requests Session used for URLs
+        timeout: request timeout in seconds
+    Returns:
+        Binary file-like object with the XML
+    """
+    if location.startswith(("http://", "https://")):
+        response = session.get(location, stream=True, timeout=timeout)
+        response.raise_for_status()
+        # Undo Content-Encoding; a .xml.gz body is still gzip after this
+        response.raw.decode_content = True
+        stream = response.raw
+    else:
+        stream = open(location, "rb")
+    head = stream.read(2)
+    stream = _PeekedStream(head, stream)
+    if head == b"\x1f\x8b":
+        return gzip.GzipFile(fileobj=stream)
+    return stream
+
+
+def parse_sitemap(stream):
+    """
+    Purpose:
+        Stream entries out of a <urlset> or <sitemapindex> document without
+        building the whole tree
+    Args:
+        stream: binary file-like object
+    Returns:
+        Generator of (kind, loc, lastmod) where kind is "url" or "sitemap"
+    """
+    root = None
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            continue
+        kind = _local_name(elem.tag)
+        if kind not in ("url", "sitemap"):
+            continue
+        loc = lastmod = None
+        for child in elem:
+            name = _local_name(child.tag)
+            if name == "loc" and child.text:
+                loc = child.text.strip()
+            elif name == "lastmod" and child.text:
+                lastmod = child.text.strip()
+        # Drop parsed entries so memory stays flat on large sitemaps
+        elem.clear()
+        root.clear()
+        if loc:
+            yield kind, loc, lastmod
+
+
+class SitemapCrawler:
+    """
+    Collects page URLs from sitemaps, following <sitemapindex> files into
+    their child sitemaps (fetched concurrently, gzipped or not). URLs are
+    deduplicated and filtered by include/exclude regular expressions.
+    """
+
+    def __init__(self, include=None, exclude=None, workers=SITEMAP_WORKERS, timeout=SITEMAP_TIMEOUT):
+        self.include = [re.compile(pattern) for pattern in include or []]
+        self.exclude = [re.compile(pattern) for pattern in exclude or []]
+        self.workers = workers
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def wanted(self, url):
+        if self.include and not any(pattern.search(url) for pattern in self.include):
+            return False
+        return not any(pattern.search(url) for pattern in self.exclude)
+
+    def _read(self, location):
+        children = []
+        urls = []
+        complete = True
+        try:
+            with open_sitemap(location, self.session, self.timeout) as stream:
+                for kind, loc, lastmod in parse_sitemap(stream):
+                    if kind == "sitemap":
+                        children.append(loc)
+                    elif self.wanted(loc):
+                        urls.append((loc, lastmod))
+        except Exception as e:
+            # Entries parsed before the error are kept, but the sitemap
+            # may list more pages than were read
+            print(f"Failed to read sitemap {location}: {e}")
+            complete = False
+        return location, children, urls, complete
+
+    def crawl(self, sitemaps):
+        """
+        Purpose:
+            Collect every page URL reachable from the given sitemaps
+        Args:
+            sitemaps: list of sitemap URLs or local paths
+        Returns:
+            Tuple of (dict of page URL -> <lastmod> text or None, in
+            discovery order; list of sitemaps that could not be read in
+            full, so their pages may be missing from the dict)
+        """
+        lastmods = {}
+        failed = []
+        seen = set()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = set()
+            for location in sitemaps:
+                if location not in seen:
+                    seen.add(location)
+                    pending.add(executor.submit(self._read, location))
+            while pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    location, children, urls, complete = future.result()
+                    if not complete:
+                        failed.append(location)
+                    for loc, lastmod in urls:
+                        lastmods.setdefault(loc, lastmod)
+                    for child in children:
+                        if child not in seen:
+                            seen.add(child)
+                            pending.add(executor.submit(self._read, child))
+        print(f"Found {len(lastmods)} URLs in {len(seen)} sitemaps, {len(failed)} could not be read")
+        return lastmods, failed
+
+
+def crawl_sitemaps(sitemaps, include=None, exclude=None):
+    """
+    Purpose:
+        Convenience wrapper around SitemapCrawler.crawl
+    Args:
+        sitemaps: list of sitemap URLs or local paths
+        include: optional regular expressions a page URL must match
+        exclude: optional regular expressions that drop a page URL
+    Returns:
+        Tuple of (dict of page URL -> <lastmod> text or None, list of
+        sitemaps that could not be read in full)
+    """
+    return SitemapCrawler(include, exclude).crawl(sitemaps)
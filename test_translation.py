@@ -0,0 +1,24 @@
+import pytest
+
+from translation import TRANSLATION_CHUNK_CHARS, split_for_translation
+
+
+def rebuilt(chunks):
+    return "".join(chunk + separator for chunk, separator in chunks)
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        ("Sentence one. " * 150).rstrip() + "\n",
+        "x. " * 700,
+        "Intro.\n\n" + "Sentence two! " * 200 + "\n\nOutro.",
+        "y" * 4000,
+    ],
+    ids=["trailing-newline", "trailing-space", "long-middle-paragraph", "no-sentence-breaks"],
+)
+def test_split_for_translation(text):
+    chunks = split_for_translation(text)
+    assert chunks
+    assert all(len(chunk) <= TRANSLATION_CHUNK_CHARS for chunk, _ in chunks)
+    assert rebuilt(chunks).split() == text.split()
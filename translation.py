@@ -0,0 +1,194 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import ai21
+
+from single_flight import SingleFlight
+
+ai21.api_key = os.environ.get('AI21_API_KEY')
+
+TRANSLATION_MODEL = os.environ.get("TRANSLATION_MODEL", "j1-large")
+# Target used when a tool is only told to translate (translation_language=True)
+TRANSLATION_LANGUAGE = os.environ.get("TRANSLATION_LANGUAGE", "Spanish")
+# j1-large has a 2048 token window shared by prompt and completion. Chunks of
+# about 1500 characters (~400 tokens) leave room for a translation that
+# is longer than the source
+TRANSLATION_CHUNK_CHARS = 1500
+TRANSLATION_MAX_TOKENS = 1024
+# Chunks translated at once, across all answers
+TRANSLATION_WORKERS = 8
+# Translations kept in memory, oldest are dropped first
+TRANSLATION_CACHE_SIZE = int(os.environ.get("TRANSLATION_CACHE_SIZE", 1000))
+
+_MARKER = "###"
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def call_ai21(prompt, max_tokens=TRANSLATION_MAX_TOKENS):
+    response = ai21.Completion.execute(
+        model=TRANSLATION_MODEL,
+        prompt=prompt,
+        temperature=0.2,
+        minTokens=1,
+        maxTokens=max_tokens,
+        numResults=1,
+        stopSequences=[_MARKER],
+    )
+    return response["completions"][0]["data"]["text"].strip()
+
+
+def _hard_split(text, max_chars):
+    return [text[i : i + max_chars] for i in range(0, len(text), max_chars)]
+
+
+def split_for_translation(text, max_chars=TRANSLATION_CHUNK_CHARS):
+    """
+    Purpose:
+        Split text into chunks the translation model can handle, at
+        paragraph and then sentence boundaries
+    Args:
+        text: text to translate
+        max_chars: characters per chunk at most
+    Returns:
+        List of (chunk, separator) pairs; joining each chunk with its
+        separator rebuilds the text up to whitespace
+    """
+    pieces = []
+    for paragraph in text.split("\n\n"):
+        if len(paragraph) <= max_chars:
+            pieces.append((paragraph, "\n\n"))
+            continue
+        # Whitespace after the last sentence would split off an empty one
+        for sentence in _SENTENCE_END.split(paragraph.strip()):
+            if not sentence:
+                continue
+            # Sentences longer than a chunk are cut mid-word, without a space
+            parts = _hard_split(sentence, max_chars)
+            pieces.extend((part, "") for part in parts[:-1])
+            pieces.append((parts[-1], " "))
+        if pieces:
+            pieces[-1] = (pieces[-1][0], "\n\n")
+
+    chunks = []
+    for piece, separator in pieces:
+        if chunks and len(chunks[-1][0]) + len(chunks[-1][1]) + len(piece) <= max_chars:
+            chunks[-1] = (chunks[-1][0] + chunks[-1][1] + piece, separator)
+        else:
+            chunks.append((piece, separator))
+    return [(chunk, separator) for chunk, separator in chunks if chunk.strip()] or [(text, "")]
+
+
+class Translator:
+    """
+    Translates answers as a stage of their own: long answers are split into
+    chunks that fit the model, chunks are translated concurrently and whole
+    translations are cached by (answer hash, language). Identical
+    translations requested at the same time run once.
+    """
+
+    def __init__(self, translate_chunk=None, max_workers=TRANSLATION_WORKERS, max_entries=TRANSLATION_CACHE_SIZE):
+        self.translate_chunk = translate_chunk or self._translate_chunk
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+        # Answers and their chunks use separate pools so an answer waiting
+        # on its chunks never holds the threads they need
+        self._answers = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="translate")
+        self._chunks = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="translate-chunk")
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _translate_chunk(chunk, language):
+        prompt = (
+            f"Translate the text between the {_MARKER} markers into {language}.\n"
+            f"{_MARKER}\n{chunk}\n{_MARKER}\n{language} translation:\n"
+        )
+        return call_ai21(prompt)
+
+    @staticmethod
+    def _key(text, language):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest(), language
+
+    def _translate(self, text, language, key):
+        chunks = split_for_translation(text)
+        translated = list(self._chunks.map(lambda chunk: self.translate_chunk(chunk[0], language), chunks))
+        result = "".join(t + separator for t, (_, separator) in zip(translated, chunks)).strip()
+        with self._lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return result
+
+    def translate(self, text, language):
+        """
+        Purpose:
+            Translate text, from the cache when it was translated before
+        Args:
+            text: text to translate
+            language: target language name, e.g. "French"
+        Returns:
+            Translated text; errors of the translation model are raised
+        """
+        key = self._key(text, language)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        return self._flights.do(key, lambda: self._translate(text, language, key))
+
+    def submit(self, text, language):
+        """
+        Purpose:
+            Start translating text without waiting for it
+        Args:
+            text: text to translate
+            language: target language name
+        Returns:
+            concurrent.futures.Future of the translated text
+        """
+        return self._answers.submit(self.translate, text, language)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+
+# Shared by every tool in the process
+translator = Translator()
+
+
+def target_language(translation_language):
+    # The app used to pass only a multilingual on/off flag
+    return TRANSLATION_LANGUAGE if translation_language is True else translation_language
+
+
+def translate_answer(resp_json, translation_language):
+    """
+    Purpose:
+        Translate a tool answer
+    Args:
+        resp_json: {"ans", "docs"} answer in English
+        translation_language: target language name, or True for
+            TRANSLATION_LANGUAGE
+    Returns:
+        {"ans", "docs", "english"} with the translated answer. If
+        translation fails the English answer is kept and
+        "translation_error" says why
+    """
+    language = target_language(translation_language)
+    try:
+        translated = translator.translate(resp_json["ans"], language)
+    except Exception as e:
+        print(f"Translation to {language} failed: {e}")
+        return {**resp_json, "english": resp_json["ans"], "translation_error": str(e)}
+    return {**resp_json, "ans": translated, "english": resp_json["ans"]}
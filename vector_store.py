@@ -0,0 +1,549 @@
+import json
+import os
+import pickle
+import sqlite3
+import shutil
+import threading
+import time
+import zlib
+from collections.abc import Mapping
+
+import numpy as np
+from langchain.docstore.base import Docstore
+from langchain.docstore.document import Document
+from langchain.vectorstores import FAISS
+from langchain.vectorstores.faiss import dependable_faiss_import
+
+from lexical_index import LexicalIndex, lexical_path, write_lexical_index
+
+# Written next to index.faiss in place of the pickled index.pkl
+DOCSTORE_SUFFIX = ".sqlite"
+# Every save writes its files to a new generation directory; this file,
+# next to the generations, names the current one
+CURRENT_SUFFIX = ".current"
+# Full-precision copy of the vectors saved next to approximate and
+# compressed indexes, so incremental updates, re-training and re-ranking
+# never start from lossy codes
+VECTORS_FILE = "vectors.npy"
+# Compressed indexes fetch k * RERANK_FACTOR candidates and re-rank them
+# against the full-precision vectors; 1 disables re-ranking. Override with
+# FAISS_RERANK or per tool in rag_tools.json
+RERANK_FACTOR = int(os.environ.get("FAISS_RERANK", 4))
+# Hybrid search fuses the top k * HYBRID_CANDIDATES rows of the vector and
+# the BM25 rankings; RRF_K damps the weight of the top ranks
+HYBRID_CANDIDATES = 4
+RRF_K = 60
+# Rows per SQL query when fetching chunks, below SQLite's variable limit
+FETCH_BATCH = 500
+
+_direct_map_lock = threading.Lock()
+
+
+def docstore_path(folder_path, index_name="index"):
+    return os.path.join(folder_path, index_name + DOCSTORE_SUFFIX)
+
+
+def store_dir(folder_path, index_name="index"):
+    """
+    Purpose:
+        Directory holding the files of the current save of an index
+    Args:
+        folder_path: local_index_* directory
+        index_name: base name of the index file
+    Returns:
+        Generation directory named by index.current, or folder_path itself
+        for indexes saved before generations were used
+    """
+    current = os.path.join(folder_path, index_name + CURRENT_SUFFIX)
+    if not os.path.exists(current):
+        return folder_path
+    with open(current) as f:
+        return os.path.join(folder_path, f.read().strip())
+
+
+class RowIds(Mapping):
+    """
+    index_to_docstore_id for stores whose documents are keyed by their row
+    in the FAISS index, so no per-chunk id table has to be held in memory.
+    """
+
+    def __init__(self, size):
+        self.size = size
+
+    def __getitem__(self, i):
+        i = int(i)
+        if not 0 <= i < self.size:
+            raise KeyError(i)
+        return i
+
+    def __iter__(self):
+        return iter(range(self.size))
+
+    def __len__(self):
+        return self.size
+
+
+class MappedFAISS(FAISS):
+    """
+    FAISS vector store opened by load_store. For approximate and compressed
+    indexes it also memory maps the full-precision vectors saved next to
+    the index, which row_vectors reads and, for compressed indexes,
+    search_with_scores re-ranks candidates against. The BM25 index used by
+    hybrid_rows is read on first use.
+    """
+
+    def __init__(
+        self,
+        embedding_function,
+        index,
+        docstore,
+        index_to_docstore_id,
+        exact_vectors=None,
+        lexical_path=None,
+        lossy=False,
+    ):
+        super().__init__(embedding_function, index, docstore, index_to_docstore_id)
+        self.exact_vectors = exact_vectors
+        self.lossy = lossy
+        self.lexical_path = lexical_path
+        self._lexical = None
+
+    def lexical_index(self):
+        if self._lexical is None and self.lexical_path and os.path.exists(self.lexical_path):
+            self._lexical = LexicalIndex.load(self.lexical_path)
+        return self._lexical
+
+
+def is_lossy(index):
+    """
+    Purpose:
+        Tell whether an index stores compressed codes rather than vectors
+    Args:
+        index: FAISS index
+    Returns:
+        True for scalar-quantized and product-quantized indexes
+    """
+    faiss = dependable_faiss_import()
+    index = faiss.downcast_index(index)
+    return isinstance(
+        index, (faiss.IndexPQ, faiss.IndexScalarQuantizer, faiss.IndexIVFPQ, faiss.IndexIVFScalarQuantizer)
+    )
+
+
+def exact_distances(exact_vectors, query_vector, rows):
+    return ((np.asarray(exact_vectors[rows], dtype=np.float32) - query_vector) ** 2).sum(axis=1)
+
+
+def rerank_rows(exact_vectors, query_vector, rows, k):
+    """
+    Purpose:
+        Order candidate rows by their exact L2 distance to the query
+    Args:
+        exact_vectors: full-precision vectors, usually memory mapped
+        query_vector: embedding of the query
+        rows: candidate rows from the compressed index
+        k: rows to keep
+    Returns:
+        The k nearest rows, nearest first
+    """
+    if not rows:
+        return rows
+    distances = exact_distances(exact_vectors, query_vector, rows)
+    return [rows[i] for i in np.argsort(distances)[:k]]
+
+
+class SqliteDocstore(Docstore):
+    """
+    Read-only docstore backed by an SQLite file. Rows are read on demand,
+    so opening a corpus costs nothing until a query needs its chunks.
+
+    sources   id, url: every source URL or path stored once
+    chunks    id (row in the FAISS index), source_id, zlib-compressed text
+              and any metadata besides the source as JSON
+    """
+
+    _select = (
+        "SELECT chunks.id, text, url, metadata FROM chunks LEFT JOIN sources ON sources.id = chunks.source_id"
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # The file is only ever replaced whole, never written in place
+            uri = "file:" + os.path.abspath(self.path) + "?mode=ro&immutable=1"
+            connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _document(text, url, metadata):
+        metadata = json.loads(metadata) if metadata else {}
+        if url is not None:
+            metadata = {"source": url, **metadata}
+        return Document(page_content=zlib.decompress(text).decode("utf-8"), metadata=metadata)
+
+    def search(self, search):
+        row = self._connection().execute(self._select + " WHERE chunks.id = ?", (int(search),)).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return self._document(*row[1:])
+
+    def fetch(self, ids):
+        """
+        Purpose:
+            Read the given rows, FETCH_BATCH rows per query
+        Args:
+            ids: list of FAISS index rows
+        Returns:
+            List of Documents in the order of ids, skipping unknown rows
+        """
+        ids = [int(i) for i in ids]
+        unique = list(dict.fromkeys(ids))
+        found = {}
+        for start in range(0, len(unique), FETCH_BATCH):
+            batch = unique[start : start + FETCH_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._connection().execute(self._select + f" WHERE chunks.id IN ({placeholders})", batch)
+            found.update((row[0], self._document(*row[1:])) for row in rows)
+        return [found[i] for i in ids if i in found]
+
+    def documents(self):
+        """
+        Purpose:
+            Read every document, in index order
+        Args:
+            N/A
+        Returns:
+            List of Documents
+        """
+        rows = self._connection().execute(self._select + " ORDER BY chunks.id")
+        return [self._document(*row[1:]) for row in rows]
+
+
+def write_docstore(path, documents) -> None:
+    """
+    Purpose:
+        Write documents to an SQLite docstore, keyed by their position
+    Args:
+        path: docstore file, replaced atomically
+        documents: Documents in index order
+    Returns:
+        N/A
+    """
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    sources = {}
+    for doc in documents:
+        source = doc.metadata.get("source")
+        if source is not None and source not in sources:
+            sources[source] = len(sources)
+
+    def rows():
+        for i, doc in enumerate(documents):
+            metadata = {key: value for key, value in doc.metadata.items() if key != "source"}
+            yield (
+                i,
+                sources.get(doc.metadata.get("source")),
+                zlib.compress(doc.page_content.encode("utf-8")),
+                json.dumps(metadata) if metadata else None,
+            )
+
+    connection = sqlite3.connect(tmp)
+    with connection:
+        connection.execute("CREATE TABLE sources (id INTEGER PRIMARY KEY, url TEXT NOT NULL)")
+        connection.execute("CREATE TABLE chunks (id INTEGER PRIMARY KEY, source_id INTEGER, text BLOB, metadata TEXT)")
+        connection.executemany("INSERT INTO sources VALUES (?, ?)", ((i, url) for url, i in sources.items()))
+        connection.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", rows())
+    connection.close()
+    os.replace(tmp, path)
+
+
+def _fetch_k(db, k, rerank):
+    # Only compressed codes are worth re-ranking against the exact vectors
+    if getattr(db, "lossy", False) and getattr(db, "exact_vectors", None) is not None and rerank > 1:
+        return k * rerank
+    return k
+
+
+def nearest_rows(db, query_vector, k=4, rerank=RERANK_FACTOR):
+    """
+    Purpose:
+        Search the index of a vector store without reading any documents
+    Args:
+        db: FAISS vector store
+        query_vector: embedding of the query
+        k: rows to return
+        rerank: see search_with_scores
+    Returns:
+        List of (row, squared L2 distance), nearest first
+    """
+    query = np.array([query_vector], dtype=np.float32)
+    exact = getattr(db, "exact_vectors", None)
+    fetch_k = _fetch_k(db, k, rerank)
+    distances, rows = db.index.search(query, fetch_k)
+    hits = [(int(i), float(d)) for i, d in zip(rows[0], distances[0]) if i != -1]
+    if fetch_k > k:
+        rows = rerank_rows(exact, query[0], [i for i, _ in hits], k)
+        hits = list(zip(rows, exact_distances(exact, query[0], rows).tolist()))
+    return hits
+
+
+def search_with_scores(db, query_vector, k=4, rerank=RERANK_FACTOR):
+    """
+    Purpose:
+        Return the k chunks nearest to a query vector with their distances,
+        reading only those k rows from an SQLite docstore
+    Args:
+        db: FAISS vector store
+        query_vector: embedding of the query
+        k: chunks to return
+        rerank: for compressed indexes, re-rank k * rerank candidates
+            against the full-precision vectors
+    Returns:
+        List of (Document, squared L2 distance), nearest first
+    """
+    if not isinstance(db.docstore, SqliteDocstore):
+        return db.similarity_search_with_score_by_vector(query_vector, k=k)
+    hits = nearest_rows(db, query_vector, k, rerank)
+    docs = db.docstore.fetch([row for row, _ in hits])
+    return list(zip(docs, [distance for _, distance in hits]))
+
+
+def search_batch(db, query_vectors, k=4, rerank=RERANK_FACTOR):
+    """
+    Purpose:
+        Search many query vectors with one FAISS search over the query
+        matrix and one docstore read for all their hits
+    Args:
+        db: FAISS vector store
+        query_vectors: list or array of query embeddings
+        k: chunks per query
+        rerank: see search_with_scores
+    Returns:
+        List with the list of Documents of each query, nearest first
+    """
+    queries = np.ascontiguousarray(query_vectors, dtype=np.float32)
+    if not len(queries):
+        return []
+    exact = getattr(db, "exact_vectors", None)
+    fetch_k = _fetch_k(db, k, rerank)
+    _, rows = db.index.search(queries, fetch_k)
+    rows = [[int(i) for i in row if i != -1] for row in rows]
+    if fetch_k > k:
+        rows = [rerank_rows(exact, query, row, k) for query, row in zip(queries, rows)]
+    unique = list(dict.fromkeys(i for row in rows for i in row))
+    found = dict(zip(unique, documents_for_rows(db, unique)))
+    return [[found[i] for i in row if i in found] for row in rows]
+
+
+def documents_for_rows(db, rows):
+    """
+    Purpose:
+        Read the documents of index rows from either docstore format
+    Args:
+        db: FAISS vector store
+        rows: rows of the FAISS index
+    Returns:
+        List of Documents in the order of rows
+    """
+    if isinstance(db.docstore, SqliteDocstore):
+        return db.docstore.fetch(rows)
+    return [db.docstore.search(db.index_to_docstore_id[i]) for i in rows]
+
+
+def row_vectors(db, rows):
+    """
+    Purpose:
+        Return the vectors of index rows, from the full-precision copy when
+        the store has one
+    Args:
+        db: FAISS vector store
+        rows: rows of the FAISS index
+    Returns:
+        float32 array with one vector per row
+    """
+    exact = getattr(db, "exact_vectors", None)
+    if exact is not None:
+        return np.asarray(exact[rows], dtype=np.float32)
+    faiss = dependable_faiss_import()
+    index = faiss.downcast_index(db.index)
+    if isinstance(index, faiss.IndexIVF):
+        # Stores without vectors.npy; the direct map is shared by every
+        # session using the cached index
+        with _direct_map_lock:
+            if not index.direct_map.type:
+                index.make_direct_map()
+    return np.array([index.reconstruct(int(i)) for i in rows], dtype=np.float32).reshape(len(rows), index.d)
+
+
+def hybrid_rows(db, query, query_vector, k=4, rerank=RERANK_FACTOR, candidates=HYBRID_CANDIDATES):
+    """
+    Purpose:
+        Rank index rows by reciprocal rank fusion of vector search and BM25
+    Args:
+        db: FAISS vector store
+        query: query text
+        query_vector: embedding of the query
+        k: rows to return
+        rerank: see search_with_scores
+        candidates: each ranking contributes its top k * candidates rows
+    Returns:
+        List of rows, best first; the nearest rows when the store has no
+        BM25 index
+    """
+    lexical = db.lexical_index() if isinstance(db, MappedFAISS) else None
+    if lexical is None:
+        return [row for row, _ in nearest_rows(db, query_vector, k, rerank)]
+    fetch_k = k * candidates
+    fused = {}
+    for ranking in (nearest_rows(db, query_vector, fetch_k, rerank), lexical.search(query, fetch_k)):
+        for rank, (row, _) in enumerate(ranking):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return sorted(fused, key=fused.get, reverse=True)[:k]
+
+
+def indexed_documents(db):
+    """
+    Purpose:
+        Read every chunk back out of a FAISS vector store, in index order
+    Args:
+        db: FAISS vector store
+    Returns:
+        List of Documents
+    """
+    if isinstance(db.docstore, SqliteDocstore):
+        return db.docstore.documents()
+    return [db.docstore.search(db.index_to_docstore_id[i]) for i in range(db.index.ntotal)]
+
+
+def save_store(db, folder_path, index_name="index", vectors=None) -> None:
+    """
+    Purpose:
+        Save a vector store as index.faiss plus an SQLite docstore, which
+        load_store can open without reading either file into memory, and
+        the BM25 index used by hybrid_rows. The files are written to a new
+        generation directory and published together by replacing
+        index.current, so a reader never pairs files of two saves
+    Args:
+        db: FAISS vector store
+        folder_path: local_index_* directory
+        index_name: base name of the index file
+        vectors: full-precision vectors to keep in VECTORS_FILE, for
+            approximate and compressed indexes
+    Returns:
+        N/A
+    """
+    faiss = dependable_faiss_import()
+    os.makedirs(folder_path, exist_ok=True)
+    previous = store_dir(folder_path, index_name)
+    generation = f"{index_name}.{time.time_ns()}"
+    path = os.path.join(folder_path, generation)
+    os.makedirs(path)
+    documents = indexed_documents(db)
+    write_docstore(docstore_path(path, index_name), documents)
+    write_lexical_index(lexical_path(path, index_name), documents)
+    faiss.write_index(db.index, os.path.join(path, f"{index_name}.faiss"))
+    if vectors is not None:
+        np.save(os.path.join(path, VECTORS_FILE), np.asarray(vectors, dtype=np.float32))
+
+    current = os.path.join(folder_path, index_name + CURRENT_SUFFIX)
+    with open(current + ".tmp", "w") as f:
+        f.write(generation)
+    os.replace(current + ".tmp", current)
+
+    # The generation just replaced stays for processes still reading it
+    # until they reload; older ones and files of the unversioned layout go
+    for name in os.listdir(folder_path):
+        if name.startswith(index_name + ".") and name[len(index_name) + 1 :].isdigit():
+            if name != generation and os.path.join(folder_path, name) != previous:
+                shutil.rmtree(os.path.join(folder_path, name), ignore_errors=True)
+    for name in (f"{index_name}.faiss", f"{index_name}.pkl", index_name + DOCSTORE_SUFFIX, VECTORS_FILE):
+        legacy = os.path.join(folder_path, name)
+        if os.path.exists(legacy):
+            os.remove(legacy)
+    if os.path.exists(lexical_path(folder_path, index_name)):
+        os.remove(lexical_path(folder_path, index_name))
+
+
+def read_index_mmap(path):
+    """
+    Purpose:
+        Open a FAISS index with its vectors memory mapped, so every process
+        serving the corpus shares one copy in the page cache
+    Args:
+        path: index.faiss file
+    Returns:
+        FAISS index
+    """
+    faiss = dependable_faiss_import()
+    # IO_FLAG_MMAP_IFC maps flat vector storage; older FAISS builds only
+    # have IO_FLAG_MMAP, which maps IVF lists
+    flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    try:
+        return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        return faiss.read_index(path)
+
+
+def load_store(folder_path, embeddings, index_name="index", mmap=True):
+    """
+    Purpose:
+        Open a saved vector store, in either format: index.faiss with an
+        SQLite docstore (memory mapped, documents read lazily) or the
+        pickled index.pkl written by FAISS.save_local
+    Args:
+        folder_path: local_index_* directory
+        embeddings: Embeddings used for queries, None if only the stored
+            vectors and documents are needed
+        index_name: base name of the index file
+        mmap: memory map the vectors instead of reading them into memory;
+            use False to modify the index in place
+    Returns:
+        FAISS vector store, a MappedFAISS unless the index is in the old
+        format
+    """
+    # Every file is read from the generation current at this point
+    folder_path = store_dir(folder_path, index_name)
+    sqlite_path = docstore_path(folder_path, index_name)
+    index_path = os.path.join(folder_path, f"{index_name}.faiss")
+    embed_query = embeddings.embed_query if embeddings is not None else None
+    faiss = dependable_faiss_import()
+    if not os.path.exists(sqlite_path):
+        # Same as FAISS.load_local, which cannot be used without embeddings
+        with open(os.path.join(folder_path, f"{index_name}.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        return FAISS(embed_query, faiss.read_index(index_path), docstore, index_to_docstore_id)
+    index = read_index_mmap(index_path) if mmap else faiss.read_index(index_path)
+    exact_vectors = None
+    vectors_path = os.path.join(folder_path, VECTORS_FILE)
+    flat = isinstance(faiss.downcast_index(index), faiss.IndexFlat)
+    if not flat and os.path.exists(vectors_path):
+        exact_vectors = np.load(vectors_path, mmap_mode="r")
+        if len(exact_vectors) != index.ntotal:
+            exact_vectors = None
+    return MappedFAISS(
+        embed_query,
+        index,
+        SqliteDocstore(sqlite_path),
+        RowIds(index.ntotal),
+        exact_vectors,
+        lexical_path(folder_path, index_name),
+        is_lossy(index),
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert indexes saved with FAISS.save_local to the mmap format, with a BM25 index")
+    parser.add_argument("index_paths", nargs="+", help="local_index_* directories")
+    args = parser.parse_args()
+    for folder_path in args.index_paths:
+        db = load_store(folder_path, None, mmap=False)
+        save_store(db, folder_path, vectors=getattr(db, "exact_vectors", None))
+        print(f"Converted {folder_path}")